@@ -0,0 +1,251 @@
+"""
+Admission control for the expensive write paths.
+
+    @app.route("/book_room", methods=["POST"])
+    @admit("booking")
+    def book_room(): ...
+
+Every route class in LIMITS has
+
+  * a token bucket per client IP and one per user (the signed-in user, or for
+    /login the account being tried). A bucket of "10/60" holds 10 tokens and
+    refills at 10 per 60 seconds;
+  * a cap on requests of that class being served at once in this worker.
+
+A request over either limit is turned away at once with 429 and Retry-After,
+before it touches the database, the KDF or the OTP store, so the requests
+that are admitted keep their usual latency instead of queueing behind a
+spike. Limits come from ADMIT_<CLASS>_IP, ADMIT_<CLASS>_USER (a "count/seconds"
+rate, or "off") and ADMIT_<CLASS>_CONCURRENCY.
+
+Buckets are kept as GCRA state: one float per key (the time the bucket will be
+full again) in a bounded LRU map. Set ADMIT_BACKEND=redis to share them
+between workers through REDIS_URL; a Lua script updates each key atomically
+on the Redis clock. If Redis is unreachable requests are admitted rather than
+refused. Concurrency caps are always per worker; they protect this worker's
+threads and connection pool.
+
+Behind a proxy set ADMIT_TRUSTED_PROXIES to the number of proxies that append
+to X-Forwarded-For, or every client shares the proxy's address.
+"""
+import functools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import flash, jsonify, render_template, request, session
+
+import instrumentation
+from database import POOL_SIZE
+from passwords import HASH_QUEUE
+
+ADMIT_BACKEND         = os.environ.get("ADMIT_BACKEND", "memory").lower()
+ADMIT_MAX_KEYS        = int(os.environ.get("ADMIT_MAX_KEYS", 100000))
+ADMIT_TRUSTED_PROXIES = int(os.environ.get("ADMIT_TRUSTED_PROXIES", 0))
+
+
+def _rate(name, default):
+    """Parses "count/seconds" into (burst, refill interval); None for "off"."""
+    value = os.environ.get(name, default).strip().lower()
+    if value in ("", "0", "off"):
+        return None
+    count, seconds = value.split("/")
+    return int(count), float(seconds) / int(count)
+
+
+class Limit:
+    def __init__(self, name, ip, user, concurrency, user_key, template=None):
+        self.name = name
+        self.ip = ip                      # (burst, interval) or None
+        self.user = user
+        self.concurrency = concurrency
+        self.user_key = user_key          # () -> key of the user the request acts for, or None
+        self.template = template          # HTML form to re-render on refusal; JSON otherwise
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            if self.in_flight >= self.concurrency:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def _session_user():
+    return session.get("user_id")
+
+
+def _login_email():
+    return (request.form.get("email") or "").strip().lower() or None
+
+
+def _limit(name, ip, user, concurrency, user_key, template=None):
+    prefix = f"ADMIT_{name.upper()}_"
+    return Limit(name, _rate(prefix + "IP", ip), _rate(prefix + "USER", user),
+                 int(os.environ.get(prefix + "CONCURRENCY", concurrency)), user_key, template)
+
+
+LIMITS = {l.name: l for l in (
+    # the KDF pool queues HASH_QUEUE hashes; refuse at the door rather than wait on it
+    _limit("login", "30/60", "10/300", HASH_QUEUE, _login_email, template="login.html"),
+    # leave part of the pool to the dashboards while a sale is on
+    _limit("booking", "20/10", "10/10", max(1, POOL_SIZE // 2), _session_user),
+    _limit("otp", "10/60", "5/60", 4, _session_user),
+)}
+
+
+class MemoryBuckets:
+    """
+    GCRA in an LRU-ordered dict: key -> time at which the bucket is full again.
+    A key whose time has passed is the same as a missing key, so sweeping pops
+    such entries off the front, and the least recently used go first when the
+    map is over max_keys.
+    """
+
+    def __init__(self, max_keys=ADMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._full_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, interval):
+        """Takes a token; returns 0 if one was there, else the seconds until one is."""
+        now = time.monotonic()
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now) + interval
+            wait = full_at - burst * interval - now
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at
+            self._full_at.move_to_end(key)
+            while self._full_at:
+                oldest, at = next(iter(self._full_at.items()))
+                if at > now and len(self._full_at) <= self.max_keys:
+                    break
+                del self._full_at[oldest]
+        return 0
+
+
+_GCRA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local burst, interval = tonumber(ARGV[1]), tonumber(ARGV[2])
+local full_at = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now) + interval
+local wait = full_at - burst * interval - now
+if wait > 0 then return tostring(wait) end
+redis.call('SET', KEYS[1], tostring(full_at), 'PX', math.ceil((full_at - now) * 1000))
+return '0'
+"""
+
+
+class RedisBuckets:
+    def __init__(self, url, prefix="hotel:admit:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._script = self._redis.register_script(_GCRA)
+        self.prefix = prefix
+
+    def take(self, key, burst, interval):
+        return float(self._script(keys=[self.prefix + key], args=[burst, interval]))
+
+
+def _make_buckets():
+    if ADMIT_BACKEND == "redis":
+        return RedisBuckets(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    return MemoryBuckets()
+
+
+buckets = _make_buckets()
+
+
+class _Metrics:
+    """Refusals by class and reason, and requests being served by class."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.refused = {}
+
+    def count(self, name, reason):
+        with self._lock:
+            self.refused[name, reason] = self.refused.get((name, reason), 0) + 1
+
+    def render(self):
+        lines = ["# HELP hotel_admission_refused_total Requests refused by admission control.",
+                 "# TYPE hotel_admission_refused_total counter"]
+        with self._lock:
+            refused = dict(self.refused)
+        for (name, reason), n in sorted(refused.items()):
+            lines.append(f'hotel_admission_refused_total{{class="{name}",reason="{reason}"}} {n}')
+        lines += ["# HELP hotel_admission_in_flight Admitted requests being served, by class.",
+                  "# TYPE hotel_admission_in_flight gauge"]
+        lines += [f'hotel_admission_in_flight{{class="{name}"}} {l.in_flight}' for name, l in LIMITS.items()]
+        return lines
+
+
+metrics = _Metrics()
+instrumentation.METRICS.append(metrics)
+
+
+def client_ip():
+    route = request.access_route
+    if ADMIT_TRUSTED_PROXIES and len(route) >= ADMIT_TRUSTED_PROXIES:
+        return route[-ADMIT_TRUSTED_PROXIES]
+    return request.remote_addr or "-"
+
+
+def check_rate(limit):
+    """Seconds the caller must wait before limit's buckets admit it (0 = admitted)."""
+    keys = []
+    if limit.ip:
+        keys.append((f"{limit.name}:ip:{client_ip()}", limit.ip))
+    user = limit.user_key() if limit.user else None
+    if user is not None:
+        keys.append((f"{limit.name}:user:{user}", limit.user))
+    for key, (burst, interval) in keys:
+        try:
+            wait = buckets.take(key, burst, interval)
+        except Exception as e:
+            print("Error checking rate limit:", e)
+            return 0
+        if wait > 0:
+            return wait
+    return 0
+
+
+def refuse(limit, reason, retry_after):
+    metrics.count(limit.name, reason)
+    message = ("Too many requests; try again in a moment." if reason == "rate"
+               else "The server is busy; try again in a moment.")
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+    if limit.template:
+        flash(message, "danger")
+        return render_template(limit.template), 429, headers
+    return jsonify({"status": "error", "message": message}), 429, headers
+
+
+def admit(name, methods=("POST",)):
+    """Runs the view only if the `name` limits admit the request; refuses with 429 otherwise."""
+    limit = LIMITS[name]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in methods:
+                return view(*args, **kwargs)
+            wait = check_rate(limit)
+            if wait:
+                return refuse(limit, "rate", wait)
+            if not limit.enter():
+                return refuse(limit, "concurrency", 1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limit.leave()
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+"""
+asyncio MySQL access (aiomysql) for the ASGI mode in asgi.py.
+
+The ASGI app opens `pool` on startup. Async code awaits it directly:
+
+    rows = await pool.fetchall("SELECT ...", params, dict_rows=True)
+
+Sync views that issue several independent queries use gather(), which runs
+them concurrently on the async pool when the app is served by asgi.py and
+one after the other on a pooled MySQLdb connection otherwise:
+
+    recent, counts = gather((RECENT_SQL, ()), (COUNTS_SQL, (ACTIVE,)), dict_rows=True)
+
+Statements still reach the database.query_hooks (Server-Timing, /metrics)
+from the calling thread. gather() waits at most ASYNC_DB_TIMEOUT seconds for
+the loop; past that it cancels the queries and raises TimeoutError.
+"""
+import asyncio
+import concurrent.futures
+import os
+import time
+
+import MySQLdb.cursors
+
+import database
+
+ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", database.POOL_SIZE * 2))
+ASYNC_TIMEOUT   = float(os.environ.get("ASYNC_DB_TIMEOUT", 30))
+
+
+class AsyncPool:
+    def __init__(self, size=ASYNC_POOL_SIZE, timeout=database.POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.loop = None
+        self._pool = None
+
+    @property
+    def running(self):
+        return self._pool is not None
+
+    async def open(self):
+        import aiomysql
+        config = dict(database.DB_CONFIG)
+        config["password"] = config.pop("passwd")
+        self._pool = await aiomysql.create_pool(minsize=1, maxsize=self.size, db=database.DB_NAME, **config)
+        self.loop = asyncio.get_running_loop()
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.close()
+            await pool.wait_closed()
+
+    async def _execute(self, sql, params, dict_rows):
+        import aiomysql
+        try:
+            conn = await asyncio.wait_for(self._pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise database.PoolExhausted(f"No async database connection available within {self.timeout}s")
+        try:
+            async with conn.cursor(aiomysql.DictCursor if dict_rows else aiomysql.Cursor) as cur:
+                start = time.perf_counter()
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+                return rows, (sql, time.perf_counter() - start, cur.rowcount)
+        finally:
+            self._pool.release(conn)
+
+    async def fetchall(self, sql, params=(), dict_rows=False):
+        rows, _ = await self._execute(sql, params, dict_rows)
+        return rows
+
+    async def gather(self, queries, dict_rows=False):
+        """[(rows, (sql, seconds, rowcount))] for each (sql, params), run concurrently."""
+        return await asyncio.gather(*(self._execute(sql, params, dict_rows) for sql, params in queries))
+
+
+pool = AsyncPool()
+
+
+def _gather_sync(queries, dict_rows):
+    db = database.get_db()
+    cur = db.cursor(MySQLdb.cursors.DictCursor) if dict_rows else db.cursor()
+    try:
+        results = []
+        for sql, params in queries:
+            cur.execute(sql, params)
+            results.append(list(cur.fetchall()))
+        return results
+    finally:
+        cur.close(); db.close()
+
+
+def gather(*queries, dict_rows=False):
+    """
+    Rows of each (sql, params), in order. Call from a request thread, never
+    from the event loop itself (await pool.gather() there).
+    """
+    if not pool.running:
+        return _gather_sync(queries, dict_rows)
+    future = asyncio.run_coroutine_threadsafe(pool.gather(queries, dict_rows), pool.loop)
+    try:
+        results = future.result(ASYNC_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        # the request gives up; don't leave its queries holding async connections
+        future.cancel()
+        raise
+    for _, (sql, seconds, rowcount) in results:
+        for hook in database.query_hooks:
+            hook(sql, seconds, rowcount)
+    return [list(rows) for rows, _ in results]
@@ -0,0 +1,227 @@
+"""
+Daily occupancy and booking rollups.
+
+    daily_occupancy  (day, room_type, floor) -> room_nights occupied that night
+    daily_bookings   (day, room_type)        -> bookings created that day, their
+                                                nights, and how many of them were
+                                                later cancelled / paid
+
+reservations.py calls record(cur, before, after) in the same transaction as
+every booking write, with the booking's facts() before and after the change.
+The rollups move by the difference once that transaction commits, in a short
+transaction of their own, so concurrent bookings never wait on (or deadlock
+over) the hot rollup rows; a deadlock there is retried. An increment that
+still fails is logged and the next backfill puts it right.
+
+Rooms without a type or floor are counted under UNKNOWN_TYPE / UNKNOWN_FLOOR.
+Rates are derived when read (see rates() and the /api/analytics/* endpoints):
+
+    occupancy     room_nights / (rooms in the group * nights in the range)
+    average stay  nights / created
+    conversion    paid / created
+    cancellation  cancelled / created
+
+Rebuild everything from `bookings` (e.g. after a manual data fix) with
+
+    python analytics.py --backfill
+"""
+import sys
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from database import PoolExhausted, get_db, on_commit, transaction
+
+# statuses whose nights count as occupied (a completed stay was occupied too)
+OCCUPYING = ("booked", "completed")
+
+# the rollup keys are NOT NULL; rooms.room_type and rooms.floor are not
+UNKNOWN_TYPE  = ""
+UNKNOWN_FLOOR = -1
+
+# ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+RETRY_ERRORS = (1213, 1205)
+RETRIES      = 3
+
+FACTS_SQL = """
+    SELECT DATE(b.created_at), COALESCE(r.room_type, %s), COALESCE(r.floor, %s), b.check_in, b.check_out, b.status, b.payment_status,
+           b.room_id
+      FROM bookings b JOIN rooms r ON b.room_id = r.id
+     WHERE b.id = %s
+"""
+FACT_KEYS = ("created", "room_type", "floor", "check_in", "check_out", "status", "payment_status", "room_id")
+
+
+# ---------------------------------------------------------------- incremental
+
+def facts(cur, booking_id):
+    """The fields of a booking the rollups depend on, or None."""
+    cur.execute(FACTS_SQL, (UNKNOWN_TYPE, UNKNOWN_FLOOR, booking_id))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    if isinstance(row, dict):   # works with DictCursor callers too
+        row = tuple(row.values())
+    return dict(zip(FACT_KEYS, row))
+
+
+def _nights(f):
+    return (f["check_out"] - f["check_in"]).days
+
+
+def _add(f, sign, per_day, per_cohort):
+    cohort = per_cohort.setdefault((f["created"], f["room_type"]), Counter())
+    cohort["created"] += sign
+    cohort["nights"] += sign * _nights(f)
+    cohort["cancelled"] += sign * (f["status"] == "cancelled")
+    cohort["paid"] += sign * (f["payment_status"] == "Paid")
+    if f["status"] in OCCUPYING:
+        for i in range(_nights(f)):
+            per_day[(f["check_in"] + timedelta(days=i), f["room_type"], f["floor"])] += sign
+
+
+def record(cur, before, after):
+    """Applies the change from `before` to `after` (either may be None) to the rollups on commit."""
+    per_day, per_cohort = Counter(), {}
+    if before:
+        _add(before, -1, per_day, per_cohort)
+    if after:
+        _add(after, 1, per_day, per_cohort)
+
+    # sorted so concurrent writers lock rollup rows in the same order
+    occupancy = sorted((k + (v,)) for k, v in per_day.items() if v)
+    cohorts = sorted((day, room_type, c["created"], c["nights"], c["cancelled"], c["paid"])
+                     for (day, room_type), c in per_cohort.items() if any(c.values()))
+    if occupancy or cohorts:
+        on_commit(lambda: apply(occupancy, cohorts))
+
+
+def apply(occupancy, cohorts):
+    """Adds the sorted deltas to both rollups in one transaction, retrying deadlocks."""
+    import MySQLdb
+    try:
+        db = get_db()
+    except PoolExhausted as e:
+        print("Error updating analytics rollups (run analytics.py --backfill):", e)
+        return
+    cur = db.cursor()
+    try:
+        for attempt in range(RETRIES):
+            try:
+                with transaction(db):
+                    _increment(cur, occupancy, cohorts)
+                return
+            except MySQLdb.OperationalError as e:
+                if e.args[0] not in RETRY_ERRORS or attempt == RETRIES - 1:
+                    raise
+                time.sleep(0.01 * (attempt + 1))
+    except MySQLdb.Error as e:
+        # the booking is already committed; the rollups catch up at the next backfill
+        print("Error updating analytics rollups (run analytics.py --backfill):", e)
+    finally:
+        cur.close(); db.close()
+
+
+def _increment(cur, occupancy, cohorts):
+    if occupancy:
+        cur.executemany("""
+            INSERT INTO daily_occupancy (day, room_type, floor, room_nights) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE room_nights = room_nights + VALUES(room_nights)
+        """, occupancy)
+    if cohorts:
+        cur.executemany("""
+            INSERT INTO daily_bookings (day, room_type, created, nights, cancelled, paid)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE created = created + VALUES(created), nights = nights + VALUES(nights),
+                                    cancelled = cancelled + VALUES(cancelled), paid = paid + VALUES(paid)
+        """, cohorts)
+
+
+def ratio(a, b):
+    return round(a / b, 4) if b else None
+
+
+def rates(c):
+    """Derived rates for a dict with created, nights, cancelled and paid counts."""
+    return {
+        "average_stay": ratio(c["nights"], c["created"]),
+        "conversion_rate": ratio(c["paid"], c["created"]),
+        "cancellation_rate": ratio(c["cancelled"], c["created"]),
+    }
+
+
+# ---------------------------------------------------------------- backfill
+
+def _expand_stays(stays):
+    """[(check_in, check_out, room_type, floor)] -> Counter of (day, room_type, floor) -> nights."""
+    try:
+        import numpy as np
+    except ImportError:
+        counts = Counter()
+        for check_in, check_out, room_type, floor in stays:
+            for i in range((check_out - check_in).days):
+                counts[(check_in + timedelta(days=i), room_type, floor)] += 1
+        return counts
+
+    if not stays:
+        return Counter()
+    starts = np.array([s[0] for s in stays], dtype="datetime64[D]")
+    nights = np.array([(s[1] - s[0]).days for s in stays], dtype=np.int64)
+    groups = {}
+    group_ids = np.array([groups.setdefault((s[2], s[3]), len(groups)) for s in stays], dtype=np.int64)
+
+    # one element per occupied night: the stay's start plus 0..nights-1
+    owner = np.repeat(np.arange(len(stays)), nights)
+    offset = np.arange(len(owner)) - np.repeat(np.cumsum(nights) - nights, nights)
+    days = starts[owner] + offset
+    keys = np.stack([days.astype(np.int64), group_ids[owner]], axis=1)
+    unique, counts = np.unique(keys, axis=0, return_counts=True)
+
+    names = {v: k for k, v in groups.items()}
+    epoch = date(1970, 1, 1)
+    return Counter({(epoch + timedelta(days=int(d)),) + names[int(g)]: int(n)
+                    for (d, g), n in zip(unique, counts)})
+
+
+def backfill(db, verbose=False):
+    """
+    Recomputes both rollups from `bookings`. Booking writes wait while it runs
+    (the rows are read with a shared lock); it also repairs any increment that
+    failed, or landed twice, after its booking committed.
+    """
+    cur = db.cursor()
+    with transaction(db):
+        cur.execute("""
+            SELECT b.check_in, b.check_out, COALESCE(r.room_type, %s), COALESCE(r.floor, %s)
+              FROM bookings b JOIN rooms r ON b.room_id = r.id
+             WHERE b.status IN %s
+             LOCK IN SHARE MODE
+        """, (UNKNOWN_TYPE, UNKNOWN_FLOOR, OCCUPYING))
+        occupancy = _expand_stays(cur.fetchall())
+
+        cur.execute("DELETE FROM daily_occupancy")
+        rows = sorted(k + (v,) for k, v in occupancy.items())
+        for i in range(0, len(rows), 1000):
+            cur.executemany("INSERT INTO daily_occupancy (day, room_type, floor, room_nights) VALUES (%s, %s, %s, %s)",
+                            rows[i:i + 1000])
+
+        cur.execute("DELETE FROM daily_bookings")
+        cur.execute("""
+            INSERT INTO daily_bookings (day, room_type, created, nights, cancelled, paid)
+            SELECT DATE(b.created_at), COALESCE(r.room_type, %s), COUNT(*), SUM(DATEDIFF(b.check_out, b.check_in)),
+                   SUM(b.status = 'cancelled'), SUM(b.payment_status = 'Paid')
+              FROM bookings b JOIN rooms r ON b.room_id = r.id
+             GROUP BY DATE(b.created_at), COALESCE(r.room_type, %s)
+        """, (UNKNOWN_TYPE, UNKNOWN_TYPE))
+    cur.close()
+    if verbose:
+        print(f"Rebuilt daily_occupancy ({len(rows)} rows) and daily_bookings")
+
+
+if __name__ == "__main__":
+    if "--backfill" in sys.argv:
+        db = get_db()
+        backfill(db, verbose=True)
+        db.close()
+    else:
+        print(__doc__)
@@ -0,0 +1,387 @@
+"""
+Keyset-paginated JSON endpoints backing the admin and manager dashboards.
+
+Every list takes ?limit= (default 50, max 200) and a cursor: the last id of the
+previous page (?after= for ascending lists, ?before= for the action log, which
+is newest first). Responses look like
+    {"status": "success", "items": [...], "next": <cursor or null>}
+
+/api/actions/export streams the whole action log instead (same filters).
+/api/analytics/* serve the daily rollups kept by analytics.py.
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import MySQLdb.cursors
+from flask import Blueprint, request, session, jsonify
+
+from aiodb import gather
+from analytics import UNKNOWN_FLOOR, UNKNOWN_TYPE, ratio, rates
+from cache import cache, ROOM_GROUPS
+from bulk import streamed
+from database import get_db, checkout
+from http_cache import conditional
+from reservations import parse_date
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+ROLES = {"admin": 1, "manager": 2, "user": 0}
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+ANALYTICS_DAYS = 30
+
+
+def _staff_only():
+    if "user_id" not in session or session.get("is_admin") not in (1, 2):
+        return jsonify({"status": "error", "message": "Access denied."}), 403
+    return None
+
+
+def _limit():
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _date_range():
+    """?from=&to= as dates; either side may be omitted. Raises ValueError."""
+    start, end = request.args.get("from"), request.args.get("to")
+    return (parse_date(start) if start else None,
+            parse_date(end) if end else None)
+
+
+def _serialize(row):
+    return {k: (v.isoformat() if isinstance(v, (date, datetime)) else v) for k, v in row.items()}
+
+
+def _page(sql, where, params, cursor_col, cursor_key, limit, descending=False):
+    """Runs one keyset page; fetches limit+1 rows to know if there is a next page."""
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {cursor_col} {'DESC' if descending else 'ASC'} LIMIT %s"
+    params.append(limit + 1)
+
+    db = get_db()
+    cur = db.cursor(MySQLdb.cursors.DictCursor)
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.close(); db.close()
+
+    items = [_serialize(r) for r in rows[:limit]]
+    next_cursor = items[-1][cursor_key] if len(rows) > limit else None
+    return jsonify({"status": "success", "items": items, "next": next_cursor})
+
+
+@api.route("/users")
+@conditional("users")
+def list_users():
+    denied = _staff_only()
+    if denied:
+        return denied
+
+    where, params = [], []
+    role = request.args.get("role")
+    if role:
+        if role.lower() not in ROLES:
+            return jsonify({"status": "error", "message": "Unknown role."}), 400
+        where.append("is_admin=%s"); params.append(ROLES[role.lower()])
+    after = request.args.get("after", type=int)
+    if after:
+        where.append("id > %s"); params.append(after)
+
+    return _page("""
+        SELECT id, name, email, contact, age,
+               IF(is_admin=1,'Admin',IF(is_admin=2,'Manager','User')) AS role
+        FROM users""", where, params, "id", "id", _limit())
+
+
+@api.route("/rooms")
+@conditional("rooms")
+def list_rooms():
+    denied = _staff_only()
+    if denied:
+        return denied
+
+    where, params = [], []
+    room_type = request.args.get("room_type")
+    if room_type:
+        where.append("room_type=%s"); params.append(room_type)
+    floor = request.args.get("floor", type=int)
+    if floor is not None:
+        where.append("floor=%s"); params.append(floor)
+    after = request.args.get("after", type=int)
+    if after:
+        where.append("number > %s"); params.append(after)
+
+    return _page("SELECT id, number, room_type, floor, capacity FROM rooms",
+                 where, params, "number", "number", _limit())
+
+
+@api.route("/bookings")
+@conditional("bookings", "users", "rooms")
+def list_bookings():
+    denied = _staff_only()
+    if denied:
+        return denied
+    try:
+        start, end = _date_range()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    where, params = [], []
+    status = request.args.get("status")
+    if status:
+        where.append("b.status=%s"); params.append(status)
+    room_type = request.args.get("room_type")
+    if room_type:
+        where.append("r.room_type=%s"); params.append(room_type)
+    floor = request.args.get("floor", type=int)
+    if floor is not None:
+        where.append("r.floor=%s"); params.append(floor)
+    # stays overlapping [from, to)
+    if start:
+        where.append("b.check_out > %s"); params.append(start)
+    if end:
+        where.append("b.check_in < %s"); params.append(end)
+    after = request.args.get("after", type=int)
+    if after:
+        where.append("b.id > %s"); params.append(after)
+
+    return _page("""
+        SELECT b.id AS booking_id, u.name AS user_name, r.room_type, r.number AS room_number,
+               r.floor, b.check_in, b.check_out, b.status, b.payment_status
+        FROM bookings b
+        JOIN rooms r ON b.room_id = r.id
+        LEFT JOIN users u ON b.user_id = u.id""",
+        where, params, "b.id", "booking_id", _limit())
+
+
+def _action_filters():
+    """WHERE parts for ?action_type=&manager_id=&from=&to=. Raises ValueError."""
+    start, end = _date_range()
+    where, params = [], []
+    action_type = request.args.get("action_type")
+    if action_type:
+        where.append("ma.action_type=%s"); params.append(action_type)
+    manager_id = request.args.get("manager_id", type=int)
+    if manager_id:
+        where.append("ma.manager_id=%s"); params.append(manager_id)
+    if start:
+        where.append("ma.action_time >= %s"); params.append(start)
+    if end:
+        where.append("ma.action_time < %s"); params.append(end)
+    return where, params
+
+
+@api.route("/actions")
+@conditional("actions", "users")
+def list_actions():
+    denied = _staff_only()
+    if denied:
+        return denied
+    try:
+        where, params = _action_filters()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    before = request.args.get("before", type=int)
+    if before:
+        where.append("ma.id < %s"); params.append(before)
+
+    return _page("""
+        SELECT ma.id, ma.action_type, ma.booking_id, ma.user_id, ma.description, ma.action_time,
+               COALESCE(u.name, 'System') AS manager_name
+        FROM manager_actions ma
+        LEFT JOIN users u ON ma.manager_id = u.id""",
+        where, params, "ma.id", "id", _limit(), descending=True)
+
+
+ACTION_COLUMNS = ("id", "action_time", "manager_id", "manager_name", "action_type",
+                  "booking_id", "user_id", "description")
+EXPORT_CHUNK = 1000
+
+
+def _stream_actions(where, params):
+    """
+    Reads the log through an unbuffered (server-side) cursor on a connection of
+    its own, EXPORT_CHUNK rows at a time, so memory does not grow with the log.
+    """
+    sql = """
+        SELECT ma.id, ma.action_time, ma.manager_id, COALESCE(u.name, 'System') AS manager_name,
+               ma.action_type, ma.booking_id, ma.user_id, ma.description
+        FROM manager_actions ma
+        LEFT JOIN users u ON ma.manager_id = u.id"""
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ma.id"
+
+    db = checkout()
+    cur = db.cursor(MySQLdb.cursors.SSDictCursor)
+    finished = False
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            yield rows
+        finished = True
+    finally:
+        if finished:
+            cur.close(); db.close()
+        else:
+            # client went away mid-stream; closing the cursor would read every remaining row
+            db.discard()
+
+
+@api.route("/actions/export")
+def export_actions():
+    """The full (filtered) action log as ?format=csv (default) or ndjson."""
+    denied = _staff_only()
+    if denied:
+        return denied
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"status": "error", "message": "format must be csv or ndjson."}), 400
+    try:
+        where, params = _action_filters()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return streamed("manager_actions", fmt, ACTION_COLUMNS, _stream_actions(where, params))
+
+
+def _analytics_range():
+    """?from= (inclusive) and ?to= (exclusive); defaults to the last ANALYTICS_DAYS days. Raises ValueError."""
+    start, end = _date_range()
+    end = end or date.today() + timedelta(days=1)
+    start = start or end - timedelta(days=ANALYTICS_DAYS)
+    if end <= start:
+        raise ValueError("'to' must be after 'from'.")
+    return start, end
+
+
+def _load_room_groups():
+    db = get_db()
+    cur = db.cursor()
+    # grouped like the rollups, which have no NULL keys
+    cur.execute("""
+        SELECT COALESCE(room_type, %s) AS t, COALESCE(floor, %s) AS f, COUNT(*) FROM rooms GROUP BY t, f
+    """, (UNKNOWN_TYPE, UNKNOWN_FLOOR))
+    groups = [list(row) for row in cur.fetchall()]
+    cur.close(); db.close()
+    return groups
+
+
+@api.route("/analytics/occupancy")
+@conditional("bookings", "rooms")
+def analytics_occupancy():
+    """?by=room_type (default) | floor | day; one row per day and group with its occupancy rate."""
+    denied = _staff_only()
+    if denied:
+        return denied
+    try:
+        start, end = _analytics_range()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    by = request.args.get("by", "room_type")
+    if by not in ("room_type", "floor", "day"):
+        return jsonify({"status": "error", "message": "by must be room_type, floor or day."}), 400
+
+    rooms = Counter()
+    for room_type, floor, count in cache.get_or_set(ROOM_GROUPS, _load_room_groups):
+        rooms[{"room_type": room_type, "floor": floor, "day": None}[by]] += count
+
+    group = "" if by == "day" else f", {by}"
+    db = get_db()
+    cur = db.cursor()
+    cur.execute(f"""
+        SELECT day{group}, SUM(room_nights) FROM daily_occupancy
+         WHERE day >= %s AND day < %s
+         GROUP BY day{group} ORDER BY day{group}
+    """, (start, end))
+    rows = cur.fetchall()
+    cur.close(); db.close()
+
+    items = []
+    for row in rows:
+        item = {"day": row[0].isoformat()}
+        key = None
+        if by != "day":
+            key = item[by] = row[1]
+        nights = int(row[-1])
+        item.update(room_nights=nights, rooms=rooms[key], rate=ratio(nights, rooms[key]))
+        items.append(item)
+    return jsonify({"status": "success", "from": start.isoformat(), "to": end.isoformat(), "items": items})
+
+
+@api.route("/analytics/bookings")
+@conditional("bookings")
+def analytics_bookings():
+    """Per creation day and room type: created, nights, cancelled, paid and the derived rates."""
+    denied = _staff_only()
+    if denied:
+        return denied
+    try:
+        start, end = _analytics_range()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    db = get_db()
+    cur = db.cursor(MySQLdb.cursors.DictCursor)
+    cur.execute("""
+        SELECT day, room_type, created, nights, cancelled, paid FROM daily_bookings
+         WHERE day >= %s AND day < %s ORDER BY day, room_type
+    """, (start, end))
+    rows = cur.fetchall()
+    cur.close(); db.close()
+
+    for row in rows:
+        row["day"] = row["day"].isoformat()
+        row.update(rates(row))
+    return jsonify({"status": "success", "from": start.isoformat(), "to": end.isoformat(), "items": rows})
+
+
+@api.route("/analytics/summary")
+@conditional("bookings", "rooms")
+def analytics_summary():
+    """Totals over the range per room type: occupancy, average stay, conversion, cancellation."""
+    denied = _staff_only()
+    if denied:
+        return denied
+    try:
+        start, end = _analytics_range()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    rooms = Counter()
+    for room_type, _, count in cache.get_or_set(ROOM_GROUPS, _load_room_groups):
+        rooms[room_type] += count
+    days = (end - start).days
+
+    occupancy, bookings = gather(("""
+        SELECT room_type, SUM(room_nights) AS room_nights FROM daily_occupancy
+         WHERE day >= %s AND day < %s GROUP BY room_type
+    """, (start, end)), ("""
+        SELECT room_type, SUM(created) AS created, SUM(nights) AS nights,
+               SUM(cancelled) AS cancelled, SUM(paid) AS paid
+          FROM daily_bookings WHERE day >= %s AND day < %s GROUP BY room_type
+    """, (start, end)), dict_rows=True)
+    occupied = {r["room_type"]: int(r["room_nights"]) for r in occupancy}
+    cohorts = {r["room_type"]: {k: int(r[k]) for k in ("created", "nights", "cancelled", "paid")}
+               for r in bookings}
+
+    items = []
+    for room_type in sorted(set(rooms) | set(occupied) | set(cohorts)):
+        c = cohorts.get(room_type, {"created": 0, "nights": 0, "cancelled": 0, "paid": 0})
+        items.append({"room_type": room_type, "rooms": rooms[room_type],
+                      "occupancy_rate": ratio(occupied.get(room_type, 0), rooms[room_type] * days),
+                      **c, **rates(c)})
+    return jsonify({"status": "success", "from": start.isoformat(), "to": end.isoformat(), "items": items})
+
+
+@api.route("/cache_stats")
+def cache_stats():
+    denied = _staff_only()
+    if denied:
+        return denied
+    return jsonify({"status": "success", **cache.stats()})
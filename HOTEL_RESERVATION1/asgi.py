@@ -0,0 +1,157 @@
+"""
+ASGI entry point: the same app on an event loop.
+
+    python migrations.py                              # release step, once per deploy
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers 4 \
+            --timeout-graceful-shutdown 30
+
+Every route keeps its Flask view, hooks and headers; what changes is what a
+connection costs while it waits:
+
+  * /events streams run on the loop (bus.subscribe_async()), so an open
+    dashboard stream is a socket and a coroutine rather than a thread, and a
+    worker holds thousands of them;
+  * every other request goes through a2wsgi's WSGIMiddleware (pip install
+    a2wsgi), which runs the Flask view on one of ASGI_THREADS threads, by
+    default one per pooled MySQL connection (DB_POOL_SIZE), so a running view
+    never waits on the pool. Idle keep-alive connections hold no thread;
+    requests beyond ASGI_THREADS wait in the executor's queue, in arrival
+    order, until a thread is free. They are not refused, so admission control
+    (admission.py) and the proxy's timeouts still bound a burst;
+  * aiomysql backs aiodb.pool, so independent queries issued together with
+    aiodb.gather() (admin dashboard, /api/analytics/summary) run concurrently
+    on separate connections.
+
+Without aiomysql installed the app still serves, with gather() falling back to
+one MySQLdb connection. Raise the open-file limit (ulimit -n) to match the
+number of streams a worker should hold. On shutdown streams still open are
+cancelled after the graceful timeout and browsers reconnect to another worker.
+
+Compare with the sync server under many open streams:
+
+    python bench.py boot --cmd "uvicorn asgi:application --port 8001" \
+                         --url http://127.0.0.1:8001 --streams 2000 --out asgi.json
+"""
+import asyncio
+import io
+import json
+import os
+
+import MySQLdb
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import session
+
+import aiodb
+import lifecycle
+from app import create_app
+from database import POOL_SIZE, PoolExhausted
+from events import HEARTBEAT, bus
+
+# more threads than connections only moves the queue onto the pool, which times out with PoolExhausted
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", POOL_SIZE))
+
+flask_app = create_app()
+
+
+class Application:
+    def __init__(self, wsgi_app, threads=ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=threads)
+        # startup, shutdown and the /events session lookup share the views' threads
+        self.executor = self.wsgi.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == "/events":
+            await self.event_stream(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    # ------------------------------------------------------------ lifespan
+
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.threads > POOL_SIZE:
+                    print(f"ASGI_THREADS ({self.threads}) is above DB_POOL_SIZE ({POOL_SIZE}); "
+                          "busy threads will wait on the connection pool")
+                try:
+                    await loop.run_in_executor(self.executor, lifecycle.check_schema)
+                except (MySQLdb.Error, PoolExhausted) as e:
+                    print("Error checking schema:", e)
+                try:
+                    await aiodb.pool.open()
+                except ImportError:
+                    print("aiomysql is not installed; gathered queries run one at a time (pip install aiomysql)")
+                except Exception as e:
+                    print("Error opening async database pool:", e)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                lifecycle.begin_drain()
+                await aiodb.pool.close()
+                await loop.run_in_executor(self.executor, lifecycle.shutdown)
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ------------------------------------------------------------ /events on the loop
+
+    def _principal(self, environ):
+        with self.wsgi_app.request_context(environ):
+            if "user_id" not in session or session.get("is_admin") not in (1, 2):
+                return None
+            return session["user_id"]
+
+    async def event_stream(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BytesIO())
+        # the session may live in MySQL or Redis; look it up off the loop
+        if await loop.run_in_executor(self.executor, self._principal, environ) is None:
+            await send({"type": "http.response.start", "status": 403,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body",
+                        "body": json.dumps({"status": "error", "message": "Access denied."}).encode()})
+            return
+
+        subscriber = bus.subscribe_async()
+        disconnected = asyncio.ensure_future(self._disconnected(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ]})
+            await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+            while not bus.closed:
+                get = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait({get, disconnected}, timeout=HEARTBEAT,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                if disconnected in done:
+                    return
+                message = get.result() if get in done else ": keep-alive\n\n"
+                if message is None:
+                    break
+                await send({"type": "http.response.body", "body": message.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            bus.unsubscribe(subscriber)
+
+    @staticmethod
+    async def _disconnected(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+
+application = Application(flask_app)
+
+
+if __name__ == "__main__":
+    print(__doc__)
@@ -0,0 +1,267 @@
+"""
+Image pipeline for the photos in static/images/.
+
+Every source image is resized to each of WIDTHS (never upscaled) and encoded
+as JPEG, WebP and, when Pillow supports it, AVIF. Derivatives are named after
+their content hash (hotel3-640.3f9a1c2e.webp) and written to static/build/,
+and static/build/manifest.json maps each source to its variants:
+
+    {"hotel3.jpg": {"source": "<sha1>", "width": 2800, "height": 1751,
+                    "variants": {"avif": [[320, "hotel3-320.ab12cd34.avif"], ...],
+                                 "webp": [...], "jpeg": [...]}}}
+
+Templates never name a derivative directly:
+
+    {{ picture("deluxe1.jpg", alt="Deluxe Room", sizes="(max-width: 600px) 90vw, 300px") }}
+    background: url("{{ asset_url('hotel3.jpg', 1920) }}") ...;
+    background-image: {{ image_set('hotel3.jpg', 1920) }};
+
+Hashed files are served from /assets/ with an immutable one-year
+Cache-Control. Without a manifest entry (Pillow missing, build not run yet)
+the helpers fall back to the original under /static/images/.
+
+Build with `python assets.py` as a release step, once per deploy. With
+ASSETS_BUILD_ON_START=1 (off by default, meant for development) the app also
+rebuilds stale entries at startup when Pillow is installed; builds hold an
+exclusive lock on static/build/.lock, so workers starting together take turns
+and the later ones find nothing stale. Sources whose hash is unchanged are
+skipped.
+"""
+import concurrent.futures
+import fcntl
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from flask import Blueprint, send_from_directory, url_for
+from markupsafe import Markup, escape
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(HERE, "static", "images")
+BUILD_DIR = os.path.join(HERE, "static", "build")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+LOCK_PATH = os.path.join(BUILD_DIR, ".lock")
+
+WIDTHS = (320, 640, 1280, 1920)
+QUALITY = {"avif": 50, "webp": 75, "jpeg": 78}
+MIME = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSION = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+ONE_YEAR = 365 * 24 * 3600
+
+ASSETS_BUILD_ON_START = os.environ.get("ASSETS_BUILD_ON_START", "0") == "1"
+ASSETS_WORKERS        = int(os.environ.get("ASSETS_WORKERS", os.cpu_count() or 1))
+
+assets = Blueprint("assets", __name__)
+
+_manifest = {}
+
+
+# ---------------------------------------------------------------- build
+
+def _formats():
+    from PIL import features
+    return [f for f in ("avif", "webp", "jpeg") if f == "jpeg" or features.check(f)]
+
+
+def _write(path, data, mode="wb"):
+    """Writes via a private temporary file, so a reader never sees a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=BUILD_DIR, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _encode(image, fmt):
+    out = io.BytesIO()
+    if fmt == "jpeg":
+        image.save(out, "JPEG", quality=QUALITY[fmt], optimize=True, progressive=True)
+    elif fmt == "avif":
+        # speed 8 is ~3x faster than the default for a few percent more bytes
+        image.save(out, "AVIF", quality=QUALITY[fmt], speed=8)
+    else:
+        image.save(out, fmt.upper(), quality=QUALITY[fmt])
+    return out.getvalue()
+
+
+def _build_one(name, digest, formats):
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(SOURCE_DIR, name)) as source:
+        # let the JPEG decoder downscale huge originals while decoding
+        source.draft("RGB", (WIDTHS[-1], WIDTHS[-1]))
+        source = ImageOps.exif_transpose(source).convert("RGB")
+        width, height = source.size
+        # the standard widths below the original, topped by the original (capped at the largest)
+        widths = sorted({w for w in WIDTHS if w < width} | {min(width, WIDTHS[-1])})
+        entry = {"source": digest, "width": width, "height": height, "variants": {f: [] for f in formats}}
+        stem = os.path.splitext(name)[0]
+        for w in widths:
+            resized = source if w == width else source.resize((w, round(height * w / width)), Image.LANCZOS)
+            for fmt in formats:
+                data = _encode(resized, fmt)
+                filename = f"{stem}-{w}.{hashlib.sha1(data).hexdigest()[:8]}.{EXTENSION[fmt]}"
+                path = os.path.join(BUILD_DIR, filename)
+                if not os.path.exists(path):
+                    _write(path, data)
+                entry["variants"][fmt].append([w, filename])
+    return entry
+
+
+def build(verbose=False):
+    """Brings static/build/ and the manifest up to date; returns how many sources were (re)built."""
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    with open(LOCK_PATH, "w") as lock:
+        # one build at a time across processes; the next one sees the fresh manifest
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _build(verbose)
+
+
+def _build(verbose):
+    manifest = load_manifest()
+    formats = _formats()
+    settings = repr((WIDTHS, QUALITY, formats)).encode()
+    names = sorted(n for n in os.listdir(SOURCE_DIR) if n.lower().endswith(SOURCE_EXTENSIONS))
+    stale = []
+    for name in names:
+        with open(os.path.join(SOURCE_DIR, name), "rb") as f:
+            digest = hashlib.sha1(f.read() + settings).hexdigest()
+        if manifest.get(name, {}).get("source") != digest:
+            stale.append((name, digest))
+
+    start = time.perf_counter()
+    args = ([n for n, _ in stale], [d for _, d in stale], [formats] * len(stale))
+    if ASSETS_WORKERS > 1 and len(stale) > 1:
+        with concurrent.futures.ProcessPoolExecutor(ASSETS_WORKERS) as pool:
+            entries = list(pool.map(_build_one, *args))
+    else:
+        entries = list(map(_build_one, *args))
+    for (name, _), entry in zip(stale, entries):
+        manifest[name] = entry
+        if verbose:
+            print(f"{name}: {len(entry['variants']['jpeg'])} sizes x {len(formats)} formats")
+    if verbose and stale:
+        print(f"{len(stale)} images in {time.perf_counter() - start:.1f}s")
+
+    for name in set(manifest) - set(names):
+        del manifest[name]
+
+    # files no manifest entry points at any more
+    keep = {filename for entry in manifest.values() for variants in entry["variants"].values()
+            for _, filename in variants}
+    for filename in os.listdir(BUILD_DIR):
+        # dotfiles are the lock and temporary files
+        if filename != os.path.basename(MANIFEST_PATH) and not filename.startswith(".") and filename not in keep:
+            os.remove(os.path.join(BUILD_DIR, filename))
+
+    _write(MANIFEST_PATH, json.dumps(manifest, indent=1, sort_keys=True), mode="w")
+    _manifest.clear()
+    _manifest.update(manifest)
+    return len(stale)
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# ---------------------------------------------------------------- template helpers
+
+def _variants(name, fmt):
+    entry = _manifest.get(name)
+    return entry["variants"].get(fmt) if entry else None
+
+
+def _pick(variants, width):
+    """The smallest variant at least `width` wide (the largest if none is, or if width is None)."""
+    if width is not None:
+        for w, filename in variants:
+            if w >= width:
+                return filename
+    return variants[-1][1]
+
+
+def asset_url(name, width=None, fmt="jpeg"):
+    """URL of the `fmt` derivative of static/images/<name> closest above `width` (largest if None)."""
+    variants = _variants(name, fmt)
+    if not variants:
+        return url_for("static", filename=f"images/{name}")
+    return url_for("assets.built", filename=_pick(variants, width))
+
+
+def srcset(name, fmt="jpeg"):
+    variants = _variants(name, fmt)
+    if not variants:
+        return ""
+    return ", ".join(f"{url_for('assets.built', filename=filename)} {w}w" for w, filename in variants)
+
+
+def image_set(name, width=None):
+    """A CSS image-set() offering AVIF/WebP/JPEG at one width, for backgrounds."""
+    if name not in _manifest:
+        return Markup(f'url("{asset_url(name)}")')
+    options = [f'url("{asset_url(name, width, fmt)}") type("{MIME[fmt]}")'
+               for fmt in ("avif", "webp", "jpeg") if _variants(name, fmt)]
+    return Markup(f"image-set({', '.join(options)})")
+
+
+def picture(name, alt="", sizes="100vw", width=640, lazy=True, **attrs):
+    """
+    <picture> with a <source> per modern format and a JPEG <img> fallback.
+    `width` picks the src for browsers without srcset support.
+    """
+    # str() so values that are already Markup (e.g. from |tojson) are escaped for the attribute too
+    attrs = "".join(f' {k.rstrip("_").replace("_", "-")}="{escape(str(v))}"' for k, v in attrs.items())
+    loading = ' loading="lazy" decoding="async"' if lazy else ""
+    entry = _manifest.get(name)
+    if not entry:
+        return Markup(f'<img src="{escape(asset_url(name))}" alt="{escape(alt)}"{loading}{attrs}>')
+    sources = "".join(f'<source type="{MIME[fmt]}" srcset="{escape(srcset(name, fmt))}" sizes="{escape(sizes)}">'
+                      for fmt in ("avif", "webp") if _variants(name, fmt))
+    return Markup(
+        f'<picture>{sources}<img src="{escape(asset_url(name, width))}" '
+        f'srcset="{escape(srcset(name))}" sizes="{escape(sizes)}" '
+        f'width="{entry["width"]}" height="{entry["height"]}" alt="{escape(alt)}"{loading}{attrs}></picture>')
+
+
+# ---------------------------------------------------------------- serving
+
+@assets.route("/assets/<path:filename>")
+def built(filename):
+    # names carry their content hash, so a cached copy can never go stale
+    response = send_from_directory(BUILD_DIR, filename, max_age=ONE_YEAR)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    if ASSETS_BUILD_ON_START:
+        try:
+            build()
+        except ImportError:
+            print("Pillow is not installed; serving original images (pip install pillow)")
+        except OSError as e:
+            # e.g. a read-only static/ in production; serve whatever was built at release
+            print("Error building images:", e)
+    _manifest.update(load_manifest())
+    app.register_blueprint(assets)
+    app.add_template_global(asset_url)
+    app.add_template_global(srcset)
+    app.add_template_global(image_set)
+    app.add_template_global(picture)
+
+
+if __name__ == "__main__":
+    print(f"Built {build(verbose=True)} images into {BUILD_DIR}")
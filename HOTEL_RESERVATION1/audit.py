@@ -0,0 +1,190 @@
+"""
+Asynchronous, batched writer for the manager_actions audit log.
+
+log_manager_action() only enqueues a row; a background thread flushes the
+queue with multi-row INSERTs every AUDIT_BATCH_SIZE rows or
+AUDIT_FLUSH_INTERVAL seconds, whichever comes first. When the queue is full
+callers block for up to AUDIT_PUT_TIMEOUT seconds (backpressure) before the row
+is spilled to AUDIT_SPILL_FILE. Rows that fail to insert are spilled as well
+and replayed after the next successful flush. The queue is drained at exit.
+
+Rows written by background jobs have no manager (manager_id NULL) and show up
+as "System" on the dashboards.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import has_request_context, session
+
+import http_cache
+from database import get_db
+from events import publish
+
+QUEUE_SIZE     = int(os.environ.get("AUDIT_QUEUE_SIZE", 10000))
+BATCH_SIZE     = int(os.environ.get("AUDIT_BATCH_SIZE", 200))
+FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0))
+PUT_TIMEOUT    = float(os.environ.get("AUDIT_PUT_TIMEOUT", 0.5))
+SPILL_FILE     = os.environ.get("AUDIT_SPILL_FILE",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_spill.jsonl"))
+
+COLUMNS = ("manager_id", "action_type", "booking_id", "user_id", "description", "action_time")
+INSERT_SQL = f"""
+    INSERT INTO manager_actions ({', '.join(COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(COLUMNS))})
+"""
+
+_STOP = object()
+
+
+class AuditWriter:
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, spill_file=SPILL_FILE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # started lazily (and again after a fork or a crash) so every worker has a live thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=PUT_TIMEOUT)
+        except queue.Full:
+            self._spill([row])
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                return
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stop = True
+                    break
+                batch.append(row)
+            try:
+                self._write(batch)
+            except Exception as e:
+                # never let one bad batch end the thread; the queue would fill up behind it
+                print("Error in audit writer:", e)
+            if stop:
+                return
+
+    def _insert(self, rows):
+        db = get_db()
+        cur = db.cursor()
+        try:
+            # MySQLdb folds executemany() on an INSERT ... VALUES into one multi-row statement
+            cur.executemany(INSERT_SQL, [tuple(r[c] for c in COLUMNS) for r in rows])
+            db.commit()
+            http_cache.bump("actions")
+        finally:
+            cur.close(); db.close()
+
+    def _write(self, batch):
+        try:
+            self._insert(batch)
+        except Exception as e:
+            print("Error writing audit batch:", e)
+            self._spill(batch)
+            return
+        self._replay_spill()
+
+    def _spill(self, rows):
+        if not self.spill_file:
+            print(f"Dropping {len(rows)} audit rows (no spill file configured)")
+            return
+        with self._lock:
+            with open(self.spill_file, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+
+    def _replay_spill(self):
+        if not self.spill_file or not os.path.exists(self.spill_file):
+            return
+        replay_path = self.spill_file + ".replay"
+        with self._lock:
+            if os.path.exists(replay_path):
+                # left over from a replay that failed part way; keep its rows
+                with open(self.spill_file, encoding="utf-8") as src, open(replay_path, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.spill_file)
+            else:
+                os.replace(self.spill_file, replay_path)
+        with open(replay_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        try:
+            for i in range(0, len(rows), self.batch_size):
+                self._insert(rows[i:i + self.batch_size])
+        except Exception as e:
+            print("Error replaying audit spill:", e)
+            try:
+                self._spill(rows[i:])
+            except OSError as e:
+                # the .replay file stays and is merged into the next replay
+                print("Error re-spilling audit rows:", e)
+                return
+        os.remove(replay_path)
+
+    def close(self, timeout=10):
+        """Flush whatever is queued and stop the writer thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+writer = AuditWriter()
+atexit.register(writer.close)
+
+
+def submit(row):
+    writer.submit(row)
+
+
+def log_manager_action(manager_id, action_type, booking_id=None, user_id=None, description=None):
+    """Queues the audit row for the background writer; never blocks on the DB."""
+    now = datetime.now()
+    submit({
+        "manager_id": manager_id,
+        "action_type": action_type,
+        "booking_id": booking_id,
+        "user_id": user_id,
+        "description": description,
+        "action_time": now.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    manager_name = session.get("user_name") if has_request_context() and manager_id else "System"
+    publish("action", {
+        "manager_name": manager_name,
+        "action_type": action_type,
+        "booking_id": booking_id,
+        "user_id": user_id,
+        "description": description,
+        "action_time": now.strftime("%Y-%m-%d %H:%M"),
+    })
@@ -0,0 +1,238 @@
+"""
+In-memory availability index behind GET /search.
+
+Rooms are numbered 0..n-1 in room-number order, and every set of rooms is a
+Python int used as a bitmap (bit i = room i):
+
+    _booked[day]        rooms with an active booking on that night
+    _by_type[type]      rooms of a type
+    _by_floor[floor]    rooms on a floor
+    _by_capacity[k]     rooms sleeping at least k guests
+
+A search ORs the nights of the stay together, masks them out of the filter
+bitmaps and counts bits for the facets, so it never touches MySQL.
+
+reservations.py calls record(before, after) next to analytics.record() for
+every booking write; the change is applied once the transaction commits, and
+a room inventory change (cache.invalidate_rooms()) forces a reload. Each
+worker keeps its own index, so a write made by another worker shows up after
+the next full reload (every AVAILABILITY_REFRESH seconds). Booking still
+re-checks the room under its row lock, so a stale search costs a 409 at worst.
+"""
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from cache import room_hooks
+from database import get_db, on_commit
+
+AVAILABILITY_REFRESH = float(os.environ.get("AVAILABILITY_REFRESH", 30))
+MAX_SEARCH_NIGHTS    = int(os.environ.get("MAX_SEARCH_NIGHTS", 60))
+
+# only active bookings block a room (completed stays are in the past)
+BLOCKING = "booked"
+
+
+def _bits(mask):
+    """Indexes of the set bits, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _nights(check_in, check_out):
+    for i in range((check_out - check_in).days):
+        yield check_in + timedelta(days=i)
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()     # one reload at a time
+        self._rooms = []           # [{id, number, room_type, floor, capacity}] in number order
+        self._position = {}        # room id -> bit
+        self._by_type = {}
+        self._by_floor = {}
+        self._by_capacity = {}
+        self._all = 0
+        self._booked = {}
+        self._replay = None        # changes seen while a reload is reading MySQL
+        self.loaded_at = None
+        self._generation = 0       # bumped by invalidate()
+
+    # ------------------------------------------------------------ loading
+
+    def load(self, db=None):
+        """Rebuilds the index from `rooms` and the active future `bookings`."""
+        with self._load_lock:
+            self._load(db)
+
+    def _load(self, db):
+        with self._lock:
+            self._replay = []
+            generation = self._generation
+        try:
+            own = db is None
+            db = db or get_db()
+            cur = db.cursor()
+            try:
+                cur.execute("SELECT id, number, room_type, floor, capacity FROM rooms ORDER BY number")
+                rooms = cur.fetchall()
+                cur.execute("SELECT room_id, check_in, check_out FROM bookings WHERE status=%s AND check_out > %s",
+                            (BLOCKING, date.today()))
+                stays = cur.fetchall()
+            finally:
+                cur.close()
+                if own:
+                    db.close()
+
+            position, by_type, by_floor, by_capacity = {}, {}, {}, {}
+            for i, (room_id, number, room_type, floor, capacity) in enumerate(rooms):
+                bit = 1 << i
+                position[room_id] = i
+                by_type[room_type] = by_type.get(room_type, 0) | bit
+                by_floor[floor] = by_floor.get(floor, 0) | bit
+                for k in range(1, (capacity or 1) + 1):
+                    by_capacity[k] = by_capacity.get(k, 0) | bit
+            booked = {}
+            for room_id, check_in, check_out in stays:
+                if room_id in position:
+                    bit = 1 << position[room_id]
+                    for day in _nights(max(check_in, date.today()), check_out):
+                        booked[day] = booked.get(day, 0) | bit
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            self._rooms = [dict(id=r[0], number=r[1], room_type=r[2], floor=r[3], capacity=r[4]) for r in rooms]
+            self._position, self._by_type, self._by_floor, self._by_capacity = position, by_type, by_floor, by_capacity
+            self._all = (1 << len(rooms)) - 1
+            self._booked = booked
+            replay, self._replay = self._replay, None
+            for room_id, check_in, check_out, taken in replay:
+                self._apply(room_id, check_in, check_out, taken)
+            # an invalidate() during the reload means what was read may already be stale
+            self.loaded_at = time.time() if generation == self._generation else None
+
+    def ensure_loaded(self):
+        if self.loaded_at is None:
+            with self._load_lock:
+                # another search may have reloaded it while this one waited
+                if self.loaded_at is None:
+                    self._load(None)
+
+    def invalidate(self):
+        """Reload on the next search, e.g. after rooms were added or bookings deleted in bulk."""
+        with self._lock:
+            self._generation += 1
+            self.loaded_at = None
+
+    # ------------------------------------------------------------ updates
+
+    def _apply(self, room_id, check_in, check_out, taken):
+        i = self._position.get(room_id)
+        if i is None:
+            return
+        bit = 1 << i
+        for day in _nights(check_in, check_out):
+            current = self._booked.get(day, 0)
+            current = current | bit if taken else current & ~bit
+            if current:
+                self._booked[day] = current
+            else:
+                self._booked.pop(day, None)
+
+    def apply(self, room_id, check_in, check_out, taken):
+        """Marks a room booked (taken=True) or free for the nights [check_in, check_out)."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((room_id, check_in, check_out, taken))
+            self._apply(room_id, check_in, check_out, taken)
+
+    # ------------------------------------------------------------ queries
+
+    def search(self, check_in, check_out, room_type=None, floor=None, capacity=None):
+        """
+        Free rooms matching every filter, plus facet counts: per room type (all
+        filters but room_type) and per floor (all filters but floor).
+        """
+        with self._lock:
+            busy = 0
+            for day in _nights(check_in, check_out):
+                busy |= self._booked.get(day, 0)
+            free = self._all & ~busy
+            if capacity:
+                free &= self._by_capacity.get(capacity, 0)
+
+            by_type = self._by_type.get(room_type, 0) if room_type else self._all
+            by_floor = self._by_floor.get(floor, 0) if floor is not None else self._all
+            matches = free & by_type & by_floor
+            rooms = [self._rooms[i] for i in _bits(matches)]
+            # lists rather than objects: floors are ints and either key may be NULL
+            facets = {
+                "room_type": [{"value": t, "count": (free & m & by_floor).bit_count()}
+                              for t, m in self._by_type.items()],
+                "floor": [{"value": f, "count": (free & m & by_type).bit_count()}
+                          for f, m in self._by_floor.items()],
+            }
+        return rooms, facets
+
+
+index = AvailabilityIndex()
+room_hooks.append(index.invalidate)
+
+
+def record(before, after):
+    """
+    Mirrors a booking write into the index once its transaction commits;
+    before/after are analytics.facts() of the booking (either may be None).
+    """
+    def apply():
+        if before and before["status"] == BLOCKING:
+            index.apply(before["room_id"], before["check_in"], before["check_out"], False)
+        if after and after["status"] == BLOCKING:
+            index.apply(after["room_id"], after["check_in"], after["check_out"], True)
+    on_commit(apply)
+
+
+class Refresher:
+    """Reloads the index every AVAILABILITY_REFRESH seconds in each worker."""
+
+    def __init__(self, interval=AVAILABILITY_REFRESH):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="availability", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                index.load()
+            except Exception as e:
+                # keep the thread alive; the next interval tries again
+                print("Error reloading availability:", e)
+
+    def stop(self):
+        self._stop.set()
+
+
+refresher = Refresher()
+
+
+def init_app(app):
+    app.before_request(refresher.ensure_started)
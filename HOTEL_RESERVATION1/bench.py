@@ -0,0 +1,589 @@
+"""
+Load-testing harness for the booking and dashboard routes.
+
+Runs against a real MySQL server (point DB_HOST/DB_PORT/DB_NAME at a scratch
+database, e.g. DB_NAME=hotel_bench) and drives the app in-process through
+Flask's test client, or over HTTP with --url against a running server.
+
+    python bench.py run --users 500 --rooms 2000 --actions 20000 \
+                        --duration 30 --concurrency 32 --out after.json
+    python bench.py compare before.json after.json --threshold 0.10
+    python bench.py logins --concurrency 64 --legacy-md5 --out logins.json
+    python bench.py boot --cmd "python app.py" --url http://127.0.0.1:5000 --out dev.json
+    python bench.py boot --cmd "gunicorn -c gunicorn.conf.py wsgi:application" \
+                         --url http://127.0.0.1:8000 --out wsgi.json
+    python bench.py boot --cmd "uvicorn asgi:application --port 8001" \
+                         --url http://127.0.0.1:8001 --streams 2000 --concurrency 128 --out asgi.json
+
+`run` writes per-route throughput and p50/p95/p99 latency as JSON and also
+counts overlapping active bookings (must be 0). `boot` starts a server command,
+times how long it takes until --probe answers, drives the same workload over
+HTTP and times the shutdown after SIGTERM; with --streams it first opens that
+many /events streams as the admin and holds them while the workload runs, to
+compare the sync and ASGI servers under many long-lived connections. `compare`
+exits non-zero when a
+route's p95 or throughput regresses by more than the threshold, so it can gate
+a deploy.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import os
+import random
+import resource
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+BENCH_PASSWORD = "bench123"
+ROOM_TYPES = ["Executive", "Deluxe", "Standard", "Family"]
+
+# every bench client shares one address and a few accounts, so the admission
+# limits (admission.py) would throttle the workload itself
+for _limit in ("LOGIN", "BOOKING", "OTP"):
+    os.environ.setdefault(f"ADMIT_{_limit}_IP", "off")
+    os.environ.setdefault(f"ADMIT_{_limit}_USER", "off")
+
+# route name -> relative weight in the mixed workload
+GUEST_MIX = {"login": 5, "user_dashboard": 35, "book_room": 25, "user_pay_booking": 10, "available_rooms": 15}
+ADMIN_MIX = {"admin_dashboard": 10}
+
+
+# ---------------------------------------------------------------- seeding
+
+def seed(db, users, rooms, actions):
+    """Idempotently tops the bench tables up to the requested volumes."""
+    cur = db.cursor()
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    cur.execute("SELECT COUNT(*) FROM users WHERE email LIKE %s", ("bench%@example.com",))
+    have = cur.fetchone()[0]
+    if have < users:
+        cur.executemany("""
+            INSERT INTO users (name, address, age, contact, email, password_hash)
+            VALUES (%s, 'Bench Street', 30, '0900000000', %s, %s)
+        """, [(f"Bench User {i}", f"bench{i}@example.com", password_hash) for i in range(have, users)])
+
+    cur.execute("SELECT COUNT(*) FROM rooms WHERE number >= 10000")
+    have = cur.fetchone()[0]
+    if have < rooms:
+        cur.executemany("""
+            INSERT INTO rooms (number, room_type, floor)
+            VALUES (%s, %s, %s)
+        """, [(10000 + i, ROOM_TYPES[i % len(ROOM_TYPES)], 1 + i // 50) for i in range(have, rooms)])
+
+    cur.execute("SELECT id FROM users WHERE is_admin=2 LIMIT 1")
+    manager = cur.fetchone()
+    cur.execute("SELECT COUNT(*) FROM manager_actions")
+    have = cur.fetchone()[0]
+    if manager and have < actions:
+        cur.executemany("""
+            INSERT INTO manager_actions (manager_id, action_type, description)
+            VALUES (%s, 'edit_user', %s)
+        """, [(manager[0], f"bench action {i}") for i in range(have, actions)])
+
+    db.commit()
+    cur.execute("SELECT number, room_type FROM rooms WHERE number >= 10000 ORDER BY number LIMIT %s", (rooms,))
+    room_list = cur.fetchall()
+    cur.close()
+    return room_list
+
+
+def count_double_bookings(db):
+    cur = db.cursor()
+    cur.execute("""
+        SELECT COUNT(*)
+          FROM bookings a
+          JOIN bookings b ON a.room_id = b.room_id AND a.id < b.id
+         WHERE a.status = 'booked' AND b.status = 'booked'
+           AND a.check_in < b.check_out AND a.check_out > b.check_in
+    """)
+    n = cur.fetchone()[0]
+    cur.close()
+    return n
+
+
+# ---------------------------------------------------------------- clients
+
+class InProcessClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None):
+        resp = self._client.open(path, method=method, data=form, json=json_body)
+        resp.close()
+        return resp.status_code
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.cookies = http.cookiejar.CookieJar()
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def request(self, method, path, form=None, json_body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self._opener.open(req) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# ---------------------------------------------------------------- workload
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}   # route -> [latency seconds]
+        self.errors = {}    # route -> count of 5xx / transport errors
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Worker(threading.Thread):
+    def __init__(self, client, email, password, mix, rooms, recorder, deadline, rng):
+        super().__init__(daemon=True)
+        self.client, self.email, self.password = client, email, password
+        self.routes, self.weights = list(mix), list(mix.values())
+        self.rooms, self.recorder, self.deadline, self.rng = rooms, recorder, deadline, rng
+        self.last_room = None
+
+    def timed(self, route, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            status = self.client.request(method, path, **kwargs)
+        except Exception:
+            status = 599
+        self.recorder.add(route, time.perf_counter() - start, status < 500)
+        return status
+
+    def login(self):
+        return self.timed("login", "POST", "/login", form={"email": self.email, "password": self.password})
+
+    def stay(self):
+        start = date.today() + timedelta(days=self.rng.randint(1, 365))
+        return start, start + timedelta(days=self.rng.randint(1, 5))
+
+    def step(self, route):
+        if route == "login":
+            self.login()
+        elif route == "user_dashboard":
+            self.timed(route, "GET", "/user_dashboard")
+        elif route == "admin_dashboard":
+            self.timed(route, "GET", "/admin_dashboard")
+        elif route == "available_rooms":
+            check_in, check_out = self.stay()
+            self.timed(route, "GET", "/available_rooms?" + urllib.parse.urlencode({
+                "check_in": check_in, "check_out": check_out, "room_type": self.rng.choice(ROOM_TYPES)}))
+        elif route == "book_room":
+            number, room_type = self.rng.choice(self.rooms)
+            check_in, check_out = self.stay()
+            status = self.timed(route, "POST", "/book_room", form={
+                "room_number": number, "room_type": room_type,
+                "check_in": check_in.isoformat(), "check_out": check_out.isoformat()})
+            if status == 200:
+                self.last_room = number
+        elif route == "user_pay_booking":
+            if self.last_room is None:
+                return
+            self.timed(route, "POST", "/user_pay_booking",
+                       json_body={"room": self.last_room, "payment_method": "cash"})
+            self.last_room = None
+
+    def run(self):
+        self.login()
+        while time.monotonic() < self.deadline:
+            self.step(self.rng.choices(self.routes, self.weights)[0])
+
+
+def drive(args, make_client, rooms):
+    """Runs the mixed workload for args.duration; returns (recorder, elapsed seconds)."""
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.duration
+
+    workers = []
+    for i in range(args.concurrency):
+        if i < args.admins:
+            workers.append(Worker(make_client(), args.admin_email, args.admin_password, ADMIN_MIX,
+                                  rooms, recorder, deadline, random.Random(rng.random())))
+        else:
+            email = f"bench{rng.randrange(args.users)}@example.com"
+            workers.append(Worker(make_client(), email, BENCH_PASSWORD, GUEST_MIX,
+                                  rooms, recorder, deadline, random.Random(rng.random())))
+
+    started = time.monotonic()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return recorder, time.monotonic() - started
+
+
+def _seed_for_workload(args):
+    from database import get_db
+    from app import init_db
+
+    init_db()
+    db = get_db()
+    rooms = seed(db, args.users, args.rooms, args.actions)
+    db.close()
+    return rooms
+
+
+def _finish(recorder, elapsed, meta, args):
+    from database import get_db
+
+    result = _report(recorder, elapsed, dict(meta, **{
+        "duration_s": round(elapsed, 3),
+        "concurrency": args.concurrency,
+        "users": args.users, "rooms": args.rooms, "actions": args.actions,
+    }))
+    db = get_db()
+    result["double_bookings"] = count_double_bookings(db)
+    db.close()
+
+    _write(result, args.out)
+    return 1 if result["double_bookings"] else 0
+
+
+def run(args):
+    from app import create_app
+
+    rooms = _seed_for_workload(args)
+    app = create_app()
+    make_client = (lambda: HttpClient(args.url)) if args.url else (lambda: InProcessClient(app))
+    recorder, elapsed = drive(args, make_client, rooms)
+    return _finish(recorder, elapsed, {"target": args.url or "in-process"}, args)
+
+
+def _wait_until_up(proc, url, timeout):
+    """Polls url until it answers 200; returns the seconds that took."""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with status {proc.returncode} before answering {url}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return time.monotonic() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    raise SystemExit(f"{url} did not answer within {timeout}s")
+
+
+class Streams(threading.Thread):
+    """Holds `count` /events streams open over raw sockets until stop() is called."""
+
+    def __init__(self, url, cookie, count, timeout=10):
+        super().__init__(daemon=True)
+        parts = urllib.parse.urlsplit(url)
+        self.host, self.port, self.netloc = parts.hostname, parts.port or 80, parts.netloc
+        self.cookie, self.count, self.timeout = cookie, count, timeout
+        self.opened, self.failed, self.dropped = [], 0, 0
+        self._closing = threading.Event()
+
+    async def _one(self):
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.failed += 1
+            return
+        opened = False
+        try:
+            writer.write(f"GET /events HTTP/1.1\r\nHost: {self.netloc}\r\nCookie: {self.cookie}\r\n"
+                         f"Accept: text/event-stream\r\n\r\n".encode())
+            status = await asyncio.wait_for(reader.readline(), self.timeout)
+            if b" 200 " not in status:
+                self.failed += 1
+                return
+            self.opened.append(time.perf_counter() - start)
+            opened = True
+            while not self._closing.is_set():
+                try:
+                    if not await asyncio.wait_for(reader.read(4096), 0.5):
+                        self.dropped += 1
+                        return
+                except asyncio.TimeoutError:
+                    pass
+        except (OSError, asyncio.TimeoutError):
+            if opened:
+                self.dropped += 1
+            else:
+                self.failed += 1
+        finally:
+            writer.close()
+
+    async def _main(self):
+        await asyncio.gather(*(self._one() for _ in range(self.count)))
+
+    def run(self):
+        # one descriptor per stream
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, self.count + 1024)), hard))
+        asyncio.run(self._main())
+
+    def stop(self):
+        self._closing.set()
+        self.join()
+
+    def report(self):
+        opened = sorted(self.opened)
+        return {"streams": self.count, "streams_open": len(opened), "streams_failed": self.failed,
+                "streams_dropped": self.dropped,
+                "stream_connect_p95_ms": None if not opened else round(_percentile(opened, 95) * 1000, 3)}
+
+
+def _open_streams(args):
+    admin = HttpClient(args.url)
+    admin.request("POST", "/login", form={"email": args.admin_email, "password": args.admin_password})
+    streams = Streams(args.url, "; ".join(f"{c.name}={c.value}" for c in admin.cookies), args.streams)
+    streams.start()
+    # let the streams connect before the workload starts
+    deadline = time.monotonic() + streams.timeout
+    while len(streams.opened) + streams.failed < args.streams and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return streams
+
+
+def boot(args):
+    """Starts --cmd, times startup until --probe answers, drives the workload, times the SIGTERM shutdown."""
+    rooms = _seed_for_workload(args)
+
+    # own process group so a reloader's child is stopped along with it
+    proc = subprocess.Popen(shlex.split(args.cmd), start_new_session=True)
+    streams = None
+    try:
+        startup = _wait_until_up(proc, args.url.rstrip("/") + args.probe, args.startup_timeout)
+        if args.streams:
+            streams = _open_streams(args)
+        recorder, elapsed = drive(args, lambda: HttpClient(args.url), rooms)
+    finally:
+        if streams:
+            streams.stop()
+        stop_started = time.monotonic()
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(args.stop_timeout)
+            shutdown = time.monotonic() - stop_started
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+            shutdown = None
+
+    return _finish(recorder, elapsed, {
+        "target": args.url, "command": args.cmd,
+        "startup_s": round(startup, 3),
+        "shutdown_s": None if shutdown is None else round(shutdown, 3),
+        **(streams.report() if streams else {}),
+    }, args)
+
+
+def logins(args):
+    """Login-only burst: many workers logging in concurrently, optionally from MD5 hashes."""
+    from database import get_db
+    from app import create_app, init_db
+    import passwords
+
+    init_db()
+    app = create_app()
+    db = get_db()
+    seed(db, args.users, 0, 0)
+    cur = db.cursor()
+    if args.legacy_md5:
+        cur.execute("UPDATE users SET password_hash=MD5(%s) WHERE email LIKE %s",
+                    (BENCH_PASSWORD, "bench%@example.com"))
+        db.commit()
+    cur.close(); db.close()
+
+    make_client = (lambda: HttpClient(args.url)) if args.url else (lambda: InProcessClient(app))
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.duration
+    workers = [Worker(make_client(), f"bench{rng.randrange(args.users)}@example.com", BENCH_PASSWORD,
+                      {"login": 1}, [], recorder, deadline, random.Random(rng.random()))
+               for _ in range(args.concurrency)]
+
+    started = time.monotonic()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.monotonic() - started
+
+    result = _report(recorder, elapsed, {
+        "target": args.url or "in-process",
+        "duration_s": round(elapsed, 3),
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "hash_method": passwords.PASSWORD_METHOD,
+        "hash_workers": passwords.HASH_WORKERS,
+    })
+    db = get_db()
+    cur = db.cursor()
+    cur.execute("SELECT COUNT(*) FROM users WHERE email LIKE %s AND password_hash NOT LIKE %s",
+                ("bench%@example.com", passwords.METHOD_PREFIX + "$%"))
+    result["outdated_hashes_left"] = cur.fetchone()[0]
+    cur.close(); db.close()
+
+    _write(result, args.out)
+    return 0
+
+
+def _report(recorder, elapsed, meta):
+    result = {"meta": meta, "routes": {}}
+    all_samples = []
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        all_samples.extend(samples)
+        result["routes"][route] = _summary(samples, recorder.errors.get(route, 0), elapsed)
+    all_samples.sort()
+    result["total"] = _summary(all_samples, sum(recorder.errors.values()), elapsed)
+    return result
+
+
+def _write(result, path):
+    output = json.dumps(result, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+def _summary(sorted_samples, errors, elapsed):
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "count": len(sorted_samples),
+        "errors": errors,
+        "throughput_rps": round(len(sorted_samples) / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(sorted_samples) / len(sorted_samples)) if sorted_samples else None,
+        "p50_ms": ms(_percentile(sorted_samples, 50)),
+        "p95_ms": ms(_percentile(sorted_samples, 95)),
+        "p99_ms": ms(_percentile(sorted_samples, 99)),
+    }
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+
+    regressed = False
+    print(f"{'route':20} {'p95 before':>11} {'p95 after':>10} {'rps before':>11} {'rps after':>10}")
+    for route in sorted(set(base["routes"]) | set(cand["routes"])):
+        b, c = base["routes"].get(route), cand["routes"].get(route)
+        if not b or not c:
+            print(f"{route:20} only in {'candidate' if c else 'baseline'}")
+            continue
+        flags = []
+        # no p95 or no throughput means nothing in the candidate run succeeded
+        if b["p95_ms"] and (c["p95_ms"] is None or c["p95_ms"] > b["p95_ms"] * (1 + args.threshold)):
+            flags.append("p95")
+        if b["throughput_rps"] and (not c["throughput_rps"]
+                                    or c["throughput_rps"] < b["throughput_rps"] * (1 - args.threshold)):
+            flags.append("rps")
+        regressed = regressed or bool(flags)
+        print(f"{route:20} {b['p95_ms']!s:>11} {c['p95_ms']!s:>10} {b['throughput_rps']!s:>11} {c['throughput_rps']!s:>10}"
+              f"  {'REGRESSED: ' + ', '.join(flags) if flags else ''}")
+    for key in ("startup_s", "shutdown_s", "streams_open", "streams_failed", "stream_connect_p95_ms"):
+        if key in base["meta"] or key in cand["meta"]:
+            print(f"{key:20} {base['meta'].get(key)!s:>11} {cand['meta'].get(key)!s:>10}")
+    if cand.get("double_bookings"):
+        print(f"candidate has {cand['double_bookings']} double bookings")
+        regressed = True
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def workload_args(p):
+        p.add_argument("--users", type=int, default=200)
+        p.add_argument("--rooms", type=int, default=500)
+        p.add_argument("--actions", type=int, default=5000)
+        p.add_argument("--duration", type=float, default=20)
+        p.add_argument("--concurrency", type=int, default=16)
+        p.add_argument("--admins", type=int, default=2, help="workers that hit the admin dashboard")
+        p.add_argument("--admin-email", default="admin@example.com")
+        p.add_argument("--admin-password", default="admin123")
+        p.add_argument("--seed", type=int, default=1)
+        p.add_argument("--out", help="write the JSON report here")
+
+    p = sub.add_parser("run", help="seed data, drive the mixed workload, report latencies")
+    p.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    workload_args(p)
+    p.set_defaults(func=run)
+
+    p = sub.add_parser("boot", help="start a server command, time startup/shutdown and drive the workload")
+    p.add_argument("--cmd", required=True, help='e.g. "python app.py" or "gunicorn -c gunicorn.conf.py wsgi:application"')
+    p.add_argument("--url", required=True, help="where the command serves, e.g. http://127.0.0.1:8000")
+    p.add_argument("--probe", default="/healthz", help="path polled until the server answers 200")
+    p.add_argument("--startup-timeout", type=float, default=60)
+    p.add_argument("--stop-timeout", type=float, default=60)
+    p.add_argument("--streams", type=int, default=0, help="/events streams to hold open during the workload")
+    workload_args(p)
+    p.set_defaults(func=boot)
+
+    p = sub.add_parser("logins", help="concurrent login burst; reports login throughput and KDF upgrades")
+    p.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--duration", type=float, default=20)
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--legacy-md5", action="store_true",
+                   help="reset bench users to unsalted MD5 first to measure the upgrade path")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", help="write the JSON report here")
+    p.set_defaults(func=logins)
+
+    p = sub.add_parser("compare", help="compare two reports; exit 1 on regression")
+    p.add_argument("baseline")
+    p.add_argument("candidate")
+    p.add_argument("--threshold", type=float, default=0.10)
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Bulk room import and streaming exports for the admin dashboard.
+
+    POST /admin_upload_file          admin_file = rooms as CSV or JSON
+    GET  /admin_export/<table>       rooms | bookings | users, ?format=csv|json|ndjson
+
+Imports are parsed as the upload streams in and upserted (by room number) with
+multi-row INSERT ... ON DUPLICATE KEY UPDATE statements of IMPORT_BATCH_SIZE
+rows, all in one transaction. Rows that fail validation are skipped and listed
+in the response. CSV needs a header row with number, room_type and optionally
+floor (defaults to number // 100) and capacity (defaults by room type, see
+DEFAULT_CAPACITY); JSON may be an array of objects or one object per line.
+
+Exports walk the table in id order IMPORT_BATCH_SIZE rows at a time and are
+sent as a chunked response, so neither side holds the whole table in memory.
+"""
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+
+import MySQLdb
+import MySQLdb.cursors
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+
+from cache import invalidate_rooms
+from database import get_db, transaction
+
+bulk = Blueprint("bulk", __name__)
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+MAX_REPORTED_ERRORS = 100
+
+# guests per room when a row doesn't say
+DEFAULT_CAPACITY = {"Standard": 2, "Deluxe": 2, "Executive": 3, "Family": 4}
+
+UPSERT_ROOMS_SQL = """
+    INSERT INTO rooms (number, room_type, floor, capacity)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE room_type=VALUES(room_type), floor=VALUES(floor), capacity=VALUES(capacity)
+"""
+
+# table -> (SELECT without WHERE/ORDER, id column, columns in output order)
+EXPORTS = {
+    "rooms": ("SELECT id, number, room_type, floor, capacity FROM rooms",
+              "id", ("id", "number", "room_type", "floor", "capacity")),
+    "bookings": ("""SELECT b.id, b.room_id, r.number AS room_number, b.user_id, b.check_in, b.check_out,
+                           b.status, b.payment_status, b.created_at
+                      FROM bookings b JOIN rooms r ON b.room_id = r.id""",
+                 "b.id", ("id", "room_id", "room_number", "user_id", "check_in", "check_out",
+                          "status", "payment_status", "created_at")),
+    "users": ("SELECT id, name, email, contact, age, address, is_admin, created_at FROM users",
+              "id", ("id", "name", "email", "contact", "age", "address", "is_admin", "created_at")),
+}
+
+
+def _admin_only():
+    if "user_id" not in session or session.get("is_admin") != 1:
+        return jsonify({"status": "error", "message": "Access denied."}), 403
+    return None
+
+
+# ---------------------------------------------------------------- import
+
+def _iter_json_objects(text, chunk_size=64 * 1024):
+    """Yields the objects of a JSON array or of newline-delimited JSON, reading in chunks."""
+    decoder = json.JSONDecoder()
+    buf, eof = "", False
+    while True:
+        buf = buf.lstrip(" \t\r\n,[]")
+        if not buf:
+            if eof:
+                return
+            chunk = text.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf)
+        except ValueError:
+            if eof:
+                raise
+            chunk = text.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+            continue
+        yield obj
+        buf = buf[end:]
+
+
+def iter_upload(upload):
+    """Yields (line, dict) for each record of an uploaded CSV or JSON file."""
+    text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    name = (upload.filename or "").lower()
+    if name.endswith(".json") or name.endswith(".ndjson") or upload.mimetype == "application/json":
+        for i, obj in enumerate(_iter_json_objects(text), start=1):
+            yield i, obj
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def default_capacity(room_type):
+    return DEFAULT_CAPACITY.get(room_type, 2)
+
+
+def validate_room(record):
+    """Returns (number, room_type, floor, capacity); raises ValueError with a readable message."""
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+    try:
+        number = int(record.get("number"))
+    except (TypeError, ValueError):
+        raise ValueError("number must be an integer")
+    if number <= 0:
+        raise ValueError("number must be positive")
+    room_type = str(record.get("room_type") or "").strip()
+    if not room_type or len(room_type) > 50:
+        raise ValueError("room_type is required (max 50 characters)")
+    floor = record.get("floor")
+    try:
+        floor = int(floor) if floor not in (None, "") else number // 100
+    except (TypeError, ValueError):
+        raise ValueError("floor must be an integer")
+    capacity = record.get("capacity")
+    try:
+        capacity = int(capacity) if capacity not in (None, "") else default_capacity(room_type)
+    except (TypeError, ValueError):
+        raise ValueError("capacity must be an integer")
+    if not 1 <= capacity <= 20:
+        raise ValueError("capacity must be between 1 and 20")
+    return number, room_type, floor, capacity
+
+
+def upsert_rooms(cur, rows):
+    """Upserts (number, room_type, floor, capacity) tuples in multi-row batches."""
+    for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+        # MySQLdb folds executemany() on an INSERT ... VALUES into one multi-row statement
+        cur.executemany(UPSERT_ROOMS_SQL, rows[i:i + IMPORT_BATCH_SIZE])
+
+
+@bulk.route("/admin_upload_file", methods=["POST"])
+def admin_upload_file():
+    denied = _admin_only()
+    if denied:
+        return denied
+
+    upload = request.files.get("admin_file")
+    if upload is None or not upload.filename:
+        return jsonify({"status": "error", "message": "Choose a CSV or JSON file to upload."})
+
+    errors, rejected, imported = [], 0, 0
+    batch = []
+    db = get_db()
+    cur = db.cursor()
+    try:
+        with transaction(db):
+            for line, record in iter_upload(upload):
+                try:
+                    batch.append(validate_room(record))
+                except ValueError as e:
+                    rejected += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({"row": line, "error": str(e)})
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    upsert_rooms(cur, batch)
+                    imported += len(batch)
+                    batch = []
+            upsert_rooms(cur, batch)
+            imported += len(batch)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"status": "error", "message": f"Could not read file: {e}"})
+    except MySQLdb.Error as e:
+        return jsonify({"status": "error", "message": f"Database error: {e}"})
+    finally:
+        cur.close(); db.close()
+
+    invalidate_rooms()
+    message = f"Imported {imported} rooms."
+    if rejected:
+        message += f" {rejected} rows rejected."
+    return jsonify({"status": "success" if imported or not rejected else "error",
+                    "message": message, "imported": imported, "rejected": rejected, "errors": errors})
+
+
+# ---------------------------------------------------------------- export
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def iter_csv(columns, rows):
+    """Encodes an iterable of chunks (lists of dicts) as CSV text, one string per chunk."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for chunk in rows:
+        for row in chunk:
+            writer.writerow([_plain(row[c]) for c in columns])
+        yield out.getvalue()
+        out.seek(0); out.truncate()
+    if out.tell():
+        yield out.getvalue()
+
+
+def iter_json_array(columns, rows):
+    first = True
+    yield "["
+    for chunk in rows:
+        parts = [json.dumps({c: _plain(row[c]) for c in columns}) for row in chunk]
+        if parts:
+            yield ("\n" if first else ",\n") + ",\n".join(parts)
+            first = False
+    yield "\n]\n"
+
+
+def iter_ndjson(columns, rows):
+    for chunk in rows:
+        yield "".join(json.dumps({c: _plain(row[c]) for c in columns}) + "\n" for row in chunk)
+
+
+FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "json": (iter_json_array, "application/json"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+}
+
+
+def streamed(filename, fmt, columns, chunks):
+    """Chunked download of `chunks` (an iterable of lists of row dicts) in one of FORMATS."""
+    encode, mimetype = FORMATS[fmt]
+    return Response(stream_with_context(encode(columns, chunks)), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}.{fmt}"',
+        "X-Accel-Buffering": "no",
+    })
+
+
+def _keyset_chunks(sql, id_column):
+    last = 0
+    while True:
+        db = get_db()
+        cur = db.cursor(MySQLdb.cursors.DictCursor)
+        cur.execute(f"{sql} WHERE {id_column} > %s ORDER BY {id_column} LIMIT %s",
+                    (last, IMPORT_BATCH_SIZE))
+        rows = cur.fetchall()
+        cur.close(); db.close()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]["id"]
+
+
+@bulk.route("/admin_export/<table>")
+def admin_export(table):
+    denied = _admin_only()
+    if denied:
+        return denied
+    if table not in EXPORTS:
+        return jsonify({"status": "error", "message": "Unknown export."}), 404
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in FORMATS:
+        return jsonify({"status": "error", "message": "format must be csv, json or ndjson."}), 400
+
+    sql, id_column, columns = EXPORTS[table]
+    return streamed(table, fmt, columns, _keyset_chunks(sql, id_column))
@@ -0,0 +1,149 @@
+"""
+Read-through cache for data that is read far more often than it changes
+(room inventory, dashboard counters).
+
+    cache.get_or_set("room_numbers", load_room_numbers, ttl=300)
+    cache.delete("room_numbers")          # from the write routes
+
+The default backend is a per-process LRU. Set CACHE_BACKEND=redis (and
+REDIS_URL) to share entries between workers so invalidations are seen by all.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = int(os.environ.get("CACHE_TTL", 300))
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 1024))
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Values are stored as JSON so every worker can read them."""
+
+    def __init__(self, url, prefix="hotel:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._redis.setex(self.prefix + key, ttl, json.dumps(value, default=str))
+
+    def delete(self, *keys):
+        if keys:
+            self._redis.delete(*(self.prefix + k for k in keys))
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + "*"):
+            self._redis.delete(key)
+
+
+class Cache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value or None; for callers that load several misses together."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        self.backend.set(key, value, ttl)
+
+    def get_or_set(self, key, loader, ttl=DEFAULT_TTL):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.backend.set(key, value, ttl)
+        return value
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else None,
+        }
+
+
+def _make_backend():
+    if os.environ.get("CACHE_BACKEND", "memory").lower() == "redis":
+        return RedisBackend(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    return MemoryBackend()
+
+
+cache = Cache(_make_backend())
+
+# keys shared by readers and the routes that invalidate them
+ROOM_NUMBERS = "room_numbers"
+ADMIN_COUNTS = "admin_counts"
+ROOM_GROUPS = "room_groups"
+
+# fn() callables run whenever the room inventory changes (see availability.py)
+room_hooks = []
+
+
+def invalidate_rooms():
+    cache.delete(ROOM_NUMBERS, ADMIN_COUNTS, ROOM_GROUPS)
+    for hook in room_hooks:
+        hook()
+
+
+def invalidate_counts():
+    cache.delete(ADMIN_COUNTS)
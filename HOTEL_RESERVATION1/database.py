@@ -0,0 +1,272 @@
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("DB_PORT", 3308)),
+    "user": os.environ.get("DB_USER", "root"),
+    "passwd": os.environ.get("DB_PASSWORD", ""),
+    "charset": "utf8mb4",
+    "autocommit": True,
+}
+DB_NAME = os.environ.get("DB_NAME", "hotel_db")
+
+POOL_SIZE    = int(os.environ.get("DB_POOL_SIZE", 10))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+# connections idle for longer than this are pinged before being handed out
+POOL_PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", 30))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+# fn(sql, seconds, rowcount) callables run after every statement (see instrumentation.py)
+query_hooks = []
+
+
+class TimedCursor:
+    """Cursor proxy that reports each statement to the query hooks."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, method, sql, args):
+        start = time.perf_counter()
+        try:
+            return method(sql, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in query_hooks:
+                hook(sql, elapsed, self._cursor.rowcount)
+
+    def execute(self, sql, args=None):
+        return self._timed(self._cursor.execute, sql, args)
+
+    def executemany(self, sql, args):
+        return self._timed(self._cursor.executemany, sql, args)
+
+
+class PooledConnection:
+    """
+    Thin proxy around a MySQLdb connection checked out of the pool.
+    Everything is forwarded to the real connection except close(),
+    which hands the connection back instead of tearing it down.
+    Connections bound to a request are only returned on teardown.
+    """
+
+    def __init__(self, pool, raw, request_bound=False, checkout_seconds=0.0):
+        self._pool = pool
+        self._raw = raw
+        self._request_bound = request_bound
+        self.checkout_seconds = checkout_seconds
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args):
+        cur = self._raw.cursor(*args)
+        return TimedCursor(cur) if query_hooks else cur
+
+    def close(self):
+        if not self._request_bound:
+            self.release()
+
+    def release(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def discard(self):
+        """Closes the connection instead of pooling it, e.g. with unread streamed rows."""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.discard(raw)
+
+
+class ConnectionPool:
+    def __init__(self, size, timeout, ping_after, **connect_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.connect_kwargs = connect_kwargs
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._inherited = []
+
+    def _connect(self):
+        # imported here so modules that only use the in-process parts load without the driver
+        import MySQLdb
+        return MySQLdb.connect(**self.connect_kwargs)
+
+    def _healthy(self, raw, idle_since):
+        import MySQLdb
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            raw.ping()
+            return True
+        except MySQLdb.Error:
+            return False
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhausted(f"No database connection available within {self.timeout}s")
+        try:
+            while True:
+                try:
+                    raw, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._healthy(raw, idle_since):
+                    return raw
+                self._discard(raw)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, raw):
+        try:
+            # drop anything a caller left half-done before the next checkout
+            raw.rollback()
+            self._idle.put((raw, time.monotonic()))
+        except Exception:
+            self._discard(raw)
+        finally:
+            self._slots.release()
+
+    def discard(self, raw):
+        self._discard(raw)
+        self._slots.release()
+
+    def clear(self):
+        """Close every idle connection (e.g. in the server master before it forks)."""
+        while True:
+            try:
+                raw, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(raw)
+
+    def reset_after_fork(self):
+        """
+        Start over in a forked child. Inherited connections share their socket
+        with the parent, so they are dropped without close() (which would send
+        COM_QUIT on the parent's connection) and kept referenced so garbage
+        collection doesn't close them either.
+        """
+        idle, self._idle = self._idle, queue.LifoQueue()
+        while True:
+            try:
+                self._inherited.append(idle.get_nowait()[0])
+            except queue.Empty:
+                break
+        self._slots = threading.BoundedSemaphore(self.size)
+
+
+pool = ConnectionPool(POOL_SIZE, POOL_TIMEOUT, POOL_PING_AFTER, db=DB_NAME, **DB_CONFIG)
+
+
+def get_db():
+    """
+    Returns a pooled connection to the hotel database.
+    Inside a request the same connection is reused for the whole
+    request and handed back to the pool on teardown, so routes
+    can keep calling db.close() as before.
+    """
+    if not has_app_context():
+        return PooledConnection(pool, pool.acquire())
+    if "db" not in g:
+        start = time.perf_counter()
+        raw = pool.acquire()
+        g.db = PooledConnection(pool, raw, request_bound=True,
+                                checkout_seconds=time.perf_counter() - start)
+    return g.db
+
+
+def checkout():
+    """
+    A pooled connection owned by the caller even inside a request, for work
+    that outlives the view function (a streamed response). Close it when done.
+    """
+    return PooledConnection(pool, pool.acquire())
+
+
+def release_db(exc=None):
+    db = g.pop("db", None)
+    if db is not None:
+        db.release()
+
+
+def create_database():
+    """Bootstraps the schema; only needed once, from init_db()."""
+    # DB_NAME goes into the DDL as an identifier, which can't be a bound parameter
+    if not re.fullmatch(r"[A-Za-z0-9_$]{1,64}", DB_NAME):
+        raise ValueError(f"DB_NAME must be a plain MySQL identifier, got {DB_NAME!r}")
+    import MySQLdb
+    conn = MySQLdb.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute(
+        f"CREATE DATABASE IF NOT EXISTS `{DB_NAME}` "
+        "CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;"
+    )
+    cur.close(); conn.close()
+
+
+# callbacks registered with on_commit() for each open transaction() of this thread
+_pending = threading.local()
+
+
+@contextmanager
+def transaction(db):
+    """
+    Runs the block as one explicit transaction on an autocommit connection:
+    committed on success, rolled back if anything raises.
+    """
+    stack = _pending.__dict__.setdefault("stack", [])
+    callbacks = []
+    stack.append(callbacks)
+    cur = db.cursor()
+    cur.execute("START TRANSACTION")
+    cur.close()
+    try:
+        yield
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        stack.pop()
+    for fn in callbacks:
+        fn()
+
+
+def on_commit(fn):
+    """Runs fn() once the current transaction commits (dropped on rollback), or now outside one."""
+    stack = getattr(_pending, "stack", None)
+    if stack:
+        stack[-1].append(fn)
+    else:
+        fn()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
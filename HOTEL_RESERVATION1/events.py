@@ -0,0 +1,142 @@
+"""
+In-process event bus with a Server-Sent Events endpoint for the dashboards.
+
+Write routes call publish("booking_paid", {...}); every open /events stream
+gets the delta pushed to it. An idle stream just blocks on its queue (plus a
+keep-alive comment every HEARTBEAT seconds), so it costs no database work.
+
+Under the threaded server (gunicorn.conf.py) every open stream holds one of
+the worker's threads, so at most EVENTS_MAX_STREAMS are served per worker and
+further ones get 503 with Retry-After. Under asgi.py streams are served on the
+event loop instead and subscribe with subscribe_async(), so an open stream
+does not hold a thread and there is no cap; serve with asgi.py when many
+dashboards stay open.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+
+from flask import Blueprint, Response, session, jsonify
+
+HEARTBEAT = 15
+SUBSCRIBER_QUEUE_SIZE = 256
+EVENTS_MAX_STREAMS = int(os.environ.get("EVENTS_MAX_STREAMS", 8))
+# seconds a refused stream is told to wait before reconnecting
+EVENTS_RETRY_AFTER = 10
+
+events = Blueprint("events", __name__)
+
+
+class EventBus:
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.threaded = 0       # subscribers holding a thread (subscribe(), not subscribe_async())
+        self.closed = False
+
+    def subscribe(self, limit=None):
+        """A queue for a stream served on its own thread, or None if `limit` of them are open."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if limit is not None and self.threaded >= limit:
+                return None
+            self.threaded += 1
+            self._subscribers.add(q)
+        return q
+
+    def subscribe_async(self):
+        """Subscribes from a coroutine; read messages from the returned handle's .queue."""
+        subscriber = AsyncSubscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+                if isinstance(q, queue.Queue):
+                    self.threaded -= 1
+
+    def publish(self, event, data):
+        # encode once, fan the same bytes out to every subscriber
+        message = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # a stalled client must not block the request that published
+                pass
+
+    def close(self):
+        """Ends every open stream (the browser reconnects to another worker), e.g. when draining."""
+        self.closed = True
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass    # the stream sees `closed` on its next loop
+
+
+class AsyncSubscriber:
+    """Feeds an asyncio.Queue on `loop` from whichever thread publishes."""
+
+    def __init__(self, loop, maxsize):
+        self._loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put_nowait(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass    # loop already closed; the stream is gone
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+
+bus = EventBus()
+
+
+def publish(event, data):
+    bus.publish(event, data)
+
+
+def _stream(q):
+    try:
+        yield "retry: 3000\n\n"
+        while not bus.closed:
+            try:
+                message = q.get(timeout=HEARTBEAT)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if message is None:
+                return
+            yield message
+    finally:
+        bus.unsubscribe(q)
+
+
+@events.route("/events")
+def event_stream():
+    if "user_id" not in session or session.get("is_admin") not in (1, 2):
+        return jsonify({"status": "error", "message": "Access denied."}), 403
+
+    q = bus.subscribe(EVENTS_MAX_STREAMS)
+    if q is None:
+        # every stream thread is taken; keep the rest of the worker's threads for requests
+        return Response(f"retry: {EVENTS_RETRY_AFTER * 1000}\n\n", status=503, mimetype="text/event-stream",
+                        headers={"Retry-After": str(EVENTS_RETRY_AFTER), "Cache-Control": "no-cache"})
+    return Response(_stream(q), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,57 @@
+"""
+gunicorn settings for serving wsgi:application.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app waits on MySQL most of the time and hashes passwords in its own KDF
+threads, so each worker process runs WEB_THREADS threads (gthread) and there
+is about one process per core. An open /events stream holds a thread for as
+long as the dashboard stays open; a worker serves at most EVENTS_MAX_STREAMS
+of them and WEB_THREADS defaults to that plus 8 for ordinary requests. Keep
+DB_POOL_SIZE >= WEB_THREADS - EVENTS_MAX_STREAMS so a busy worker doesn't
+queue on the pool. For many open dashboards serve asgi.py instead, where
+streams hold no thread.
+
+The app is loaded once in the master and forked (preload_app). The master
+closes its pooled connections before each fork and every child starts with an
+empty pool; background threads start lazily in each child.
+"""
+import multiprocessing
+import os
+import signal
+
+import database
+import lifecycle
+from events import EVENTS_MAX_STREAMS
+
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", EVENTS_MAX_STREAMS + 8))
+if threads <= EVENTS_MAX_STREAMS:
+    raise ValueError(f"WEB_THREADS ({threads}) must be above EVENTS_MAX_STREAMS ({EVENTS_MAX_STREAMS}), "
+                     "or open /events streams leave no thread for other requests")
+preload_app = True
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+keepalive = 5
+# SIGTERM -> DRAIN_GRACE seconds still serving -> up to DRAIN_TIMEOUT for in-flight requests
+graceful_timeout = int(lifecycle.DRAIN_GRACE + lifecycle.DRAIN_TIMEOUT)
+accesslog = os.environ.get("ACCESS_LOG")   # e.g. "-" for stdout
+
+
+def pre_fork(server, worker):
+    # connections opened while loading the app (the schema check) must not be shared
+    database.pool.clear()
+
+
+def post_fork(server, worker):
+    database.pool.reset_after_fork()
+
+
+def post_worker_init(worker):
+    # gunicorn's own handler only stops the accept loop; drain first, then let it
+    lifecycle.on_sigterm(lambda: worker.handle_exit(signal.SIGTERM, None))
+
+
+def worker_exit(server, worker):
+    lifecycle.shutdown()
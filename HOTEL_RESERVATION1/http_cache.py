@@ -0,0 +1,201 @@
+"""
+Conditional GETs and response compression.
+
+Views that only show database state declare the tables they read:
+
+    @app.route("/admin_get_actions")
+    @conditional("actions", "users")
+    def admin_get_actions(): ...
+
+Each table has a change counter that the write paths bump (bump() directly,
+or bump_on_commit() inside a transaction). The ETag is a hash of those
+counters, the URL, the signed-in user and the release, so it costs no query:
+a matching If-None-Match gets a 304 before the view runs. Responses are
+marked `private, no-cache`, so browsers revalidate every time and get the
+304 cheaply.
+
+Counters live in Redis when CACHE_BACKEND=redis, shared by every worker.
+Otherwise each process keeps its own and puts a random epoch in its ETags,
+so a worker never answers 304 to an ETag issued by another worker.
+
+HTML, JSON and text responses of COMPRESS_MIN_BYTES or more are compressed
+with brotli (if the `brotli` package is installed and the client accepts it)
+or gzip. Streamed responses are passed through untouched.
+"""
+import functools
+import glob
+import gzip
+import hashlib
+import os
+import secrets
+import threading
+from datetime import date
+
+from flask import Response, make_response, request, session
+
+from cache import room_hooks
+from database import on_commit
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL     = int(os.environ.get("COMPRESS_LEVEL", 5))
+COMPRESS_MIMETYPES = {"text/html", "application/json", "text/plain", "text/css", "application/javascript"}
+
+TABLES = ("users", "rooms", "bookings", "actions")
+
+
+class MemoryVersions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(TABLES, 0)
+        self.epoch = secrets.token_hex(8)
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._counters[table] += 1
+
+    def get(self, tables):
+        return [self.epoch] + [self._counters[t] for t in tables]
+
+
+class RedisVersions:
+    """
+    INCR/GET counters. The epoch is created once with SETNX, so if Redis loses
+    the counters it loses the epoch too and no old ETag can match again.
+    """
+
+    def __init__(self, url, prefix="hotel:version:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._redis.setnx(prefix + "epoch", secrets.token_hex(8))
+
+    def bump(self, *tables):
+        pipe = self._redis.pipeline()
+        for table in tables:
+            pipe.incr(self.prefix + table)
+        pipe.execute()
+
+    def get(self, tables):
+        pipe = self._redis.pipeline()
+        pipe.get(self.prefix + "epoch")
+        for table in tables:
+            pipe.get(self.prefix + table)
+        epoch, *values = pipe.execute()
+        return [(epoch or b"").decode()] + [int(v or 0) for v in values]
+
+
+def _make_versions():
+    if os.environ.get("CACHE_BACKEND", "memory").lower() == "redis":
+        return RedisVersions(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    return MemoryVersions()
+
+
+versions = _make_versions()
+room_hooks.append(lambda: bump("rooms"))
+
+# templates and built assets change with a deploy; set at init_app()
+_release = ""
+
+
+def bump(*tables):
+    """Marks the tables as changed; call after the write is committed."""
+    try:
+        versions.bump(*tables)
+    except Exception as e:
+        # a lost bump would let clients keep a stale page, so fail loudly but don't break the write
+        print("Error bumping table versions:", e)
+
+
+def bump_on_commit(*tables):
+    on_commit(lambda: bump(*tables))
+
+
+def etag_for(tables):
+    parts = [_release] + versions.get(tables)
+    # today's date too: default date ranges and date pickers move at midnight
+    parts += [request.full_path, date.today().isoformat(),
+              session.get("user_id"), session.get("is_admin"), session.get("user_name")]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def conditional(*tables):
+    """Answers If-None-Match with 304 when none of `tables` changed since the client's copy."""
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables: {unknown}")
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                etag = etag_for(tables)
+            except Exception as e:
+                print("Error reading table versions:", e)
+                return view(*args, **kwargs)
+            # a pending flash() must be rendered (and consumed) by the view
+            if request.if_none_match.contains_weak(etag) and not session.get("_flashes"):
+                response = Response(status=304)
+            else:
+                response = view(*args, **kwargs)
+                response = make_response(response)
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------------- compression
+
+_brotli = None
+
+
+def _encode(body, encoding):
+    if encoding == "br":
+        return _brotli.compress(body, quality=COMPRESS_LEVEL)
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+
+
+def compress(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESS_MIMETYPES or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = request.accept_encodings.best_match(["br", "gzip"] if _brotli else ["gzip"])
+    if encoding is None:
+        return response
+    response.set_data(_encode(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def _release_id(app):
+    """Hash of the templates and the asset manifest, so a deploy changes every ETag."""
+    digest = hashlib.sha1()
+    paths = sorted(glob.glob(os.path.join(app.root_path, "templates", "*.html")))
+    paths.append(os.path.join(app.root_path, "static", "build", "manifest.json"))
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()[:12]
+
+
+def init_app(app):
+    global _brotli, _release
+    try:
+        import brotli
+        _brotli = brotli
+    except ImportError:
+        _brotli = None
+    _release = _release_id(app)
+    app.after_request(compress)
@@ -0,0 +1,205 @@
+"""
+Idempotency-Key support for the booking and payment mutations.
+
+    @app.route("/book_room", methods=["POST"])
+    @idempotent
+    def book_room(): ...
+
+A client sends the same Idempotency-Key header with every retry of one
+logical request. The first request with a key (per user and route) runs the
+view and its response is kept for IDEMPOTENCY_TTL seconds; a retry with that
+key gets the stored response back, with `Idempotent-Replayed: true`, without
+the view running again. A duplicate that arrives while the first is still
+being served waits up to IDEMPOTENCY_WAIT seconds for its result instead of
+running in parallel, and gets 409 with Retry-After if it is still not done.
+
+Each key remembers a fingerprint of the request body; reusing a key for a
+different request is refused with 422. Responses with a 5xx or 429 status
+are not kept, so a retry after a failure runs the view again. Changes the
+view made to the session are not replayed. Requests without the header, or
+from a signed-out user, are served as before.
+
+IDEMPOTENCY_BACKEND=redis keeps the keys in REDIS_URL so a retry that lands
+on another worker is recognised too; the default is a per-process store of at
+most IDEMPOTENCY_MAX_KEYS entries.
+"""
+import base64
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, make_response, request, session
+
+IDEMPOTENCY_TTL      = int(os.environ.get("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", 10000))
+IDEMPOTENCY_WAIT     = float(os.environ.get("IDEMPOTENCY_WAIT", 10))
+# a claimed key whose request never finished (worker killed) is freed after this long
+IDEMPOTENCY_LOCK_TTL = int(os.environ.get("IDEMPOTENCY_LOCK_TTL", 60))
+MAX_KEY_LENGTH       = 255
+KEPT_HEADERS         = ("Content-Type", "Location")
+
+
+class MemoryStore:
+    """
+    Records in insertion order; all share one lifetime, so expired records are
+    always at the front. Past max_keys the oldest are dropped, finished or not.
+    """
+
+    def __init__(self, max_keys=IDEMPOTENCY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._records = OrderedDict()   # key -> {"fp", "response", "expires", "done"}
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        # runs before a claim adds its record, so leave room for it
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record["expires"] > now and len(self._records) < self.max_keys:
+                break
+            del self._records[key]
+
+    def claim(self, key, fingerprint):
+        """(True, record) if this request now owns the key, else (False, the existing record)."""
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            record = self._records.get(key)
+            if record is not None:
+                return False, record
+            record = self._records[key] = {"fp": fingerprint, "response": None,
+                                           "expires": now + IDEMPOTENCY_TTL, "done": threading.Event()}
+            return True, record
+
+    def wait(self, key, record, timeout):
+        """The record once finished, still unfinished on timeout, or None if its owner gave up."""
+        record["done"].wait(timeout)
+        if record["response"] is not None:
+            return record
+        with self._lock:
+            return self._records.get(key)
+
+    def finish(self, key, record, response):
+        record["response"] = response
+        record["done"].set()
+
+    def abandon(self, key, record):
+        with self._lock:
+            if self._records.get(key) is record:
+                del self._records[key]
+        record["done"].set()
+
+
+class RedisStore:
+    def __init__(self, url, prefix="hotel:idem:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def claim(self, key, fingerprint):
+        record = {"fp": fingerprint, "response": None}
+        while True:
+            if self._redis.set(self.prefix + key, json.dumps(record), nx=True, ex=IDEMPOTENCY_LOCK_TTL):
+                return True, record
+            raw = self._redis.get(self.prefix + key)
+            if raw is not None:
+                return False, json.loads(raw)
+
+    def wait(self, key, record, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            raw = self._redis.get(self.prefix + key)
+            if raw is None:
+                return None
+            record = json.loads(raw)
+            if record["response"] is not None:
+                break
+        return record
+
+    def finish(self, key, record, response):
+        status, headers, body = response
+        record = dict(record, response=[status, headers, base64.b64encode(body).decode()])
+        self._redis.set(self.prefix + key, json.dumps(record), ex=IDEMPOTENCY_TTL)
+
+    def abandon(self, key, record):
+        self._redis.delete(self.prefix + key)
+
+
+def _make_store():
+    if os.environ.get("IDEMPOTENCY_BACKEND", "memory").lower() == "redis":
+        return RedisStore(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    return MemoryStore()
+
+
+store = _make_store()
+
+
+def fingerprint():
+    # form bodies are parsed (and consumed) first; JSON bodies stay in get_data()
+    data = request.get_data(cache=True, parse_form_data=True)
+    parts = (request.method, request.path, sorted(request.form.items(multi=True)), data)
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _replay(response):
+    status, headers, body = response
+    if isinstance(body, str):
+        body = base64.b64decode(body)
+    return body, status, dict(headers, **{"Idempotent-Replayed": "true"})
+
+
+def _error(message, status, **headers):
+    return jsonify({"status": "error", "message": message}), status, headers
+
+
+def idempotent(view):
+    """Runs `view` at most once per Idempotency-Key (see module docstring)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get("Idempotency-Key")
+        if not header or "user_id" not in session:
+            return view(*args, **kwargs)
+        if len(header) > MAX_KEY_LENGTH:
+            return _error("Idempotency-Key is too long.", 400)
+
+        key = f"{session['user_id']}:{request.path}:{header}"
+        fp = fingerprint()
+        while True:
+            try:
+                owner, record = store.claim(key, fp)
+            except Exception as e:
+                # without the store the retry can't be recognised; serve it like a request without a key
+                print("Error claiming idempotency key:", e)
+                return view(*args, **kwargs)
+            if owner:
+                break
+            if record["fp"] != fp:
+                return _error("Idempotency-Key was already used for a different request.", 422)
+            if record["response"] is None:
+                record = store.wait(key, record, IDEMPOTENCY_WAIT)
+                if record is None:
+                    continue        # the first request failed; this one runs instead
+                if record["response"] is None:
+                    return _error("A request with this Idempotency-Key is still being processed.", 409,
+                                  **{"Retry-After": "1"})
+            return _replay(record["response"])
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            store.abandon(key, record)
+            raise
+        try:
+            if response.status_code >= 500 or response.status_code == 429 or response.is_streamed:
+                store.abandon(key, record)
+            else:
+                headers = [(h, response.headers[h]) for h in KEPT_HEADERS if h in response.headers]
+                store.finish(key, record, (response.status_code, headers, response.get_data()))
+        except Exception as e:
+            print("Error storing idempotent response:", e)
+        return response
+    return wrapper
@@ -0,0 +1,186 @@
+"""
+Per-request profiling and SQL instrumentation.
+
+For every request this records connection checkout time, each SQL statement
+(duration and row count), template rendering time and any blocks wrapped in
+timed("name"), and reports them in a Server-Timing header:
+
+    Server-Timing: conn;dur=0.4, db;dur=6.1;desc="4 queries", tpl;dur=2.3, total;dur=11.0
+
+Aggregated per-route histograms are served in Prometheus text format at
+/metrics to scrapers that send "Authorization: Bearer $METRICS_TOKEN"; without
+a METRICS_TOKEN the endpoint answers 404. Set PROFILE_SLOW_MS to profile a
+PROFILE_SAMPLE fraction of requests with cProfile and keep a dump (in
+PROFILE_DIR) of the ones slower than that many milliseconds.
+"""
+import bisect
+import cProfile
+import hmac
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, g, has_request_context, request, before_render_template, template_rendered
+
+import database
+
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 0))
+PROFILE_SAMPLE = float(os.environ.get("PROFILE_SAMPLE", 0.01))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label="route"):
+        self.name, self.help, self.buckets, self.label = name, help_text, buckets, label
+        self._lock = threading.Lock()
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    def __init__(self, name, help_text, read):
+        self.name, self.help, self.read = name, help_text, read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+REQUEST_SECONDS = Histogram("hotel_request_duration_seconds", "Request latency by route.")
+DB_SECONDS = Histogram("hotel_db_time_seconds", "Time spent in SQL per request, by route.")
+DB_QUERIES = Histogram("hotel_db_queries_per_request", "SQL statements per request, by route.",
+                       buckets=(1, 2, 4, 8, 16, 32, 64))
+TEMPLATE_SECONDS = Histogram("hotel_template_render_seconds", "Jinja render time, by template.",
+                             label="template")
+
+# other modules append their own Histogram/Gauge objects here
+METRICS = [REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, TEMPLATE_SECONDS]
+
+
+def _timings():
+    if not has_request_context():
+        return None
+    if "timings" not in g:
+        g.timings = {"queries": 0, "db": 0.0, "rows": 0, "tpl": 0.0}
+    return g.timings
+
+
+@contextmanager
+def timed(name):
+    """Adds the block's wall time to this request's Server-Timing entry `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        t = _timings()
+        if t is not None:
+            t[name] = t.get(name, 0.0) + time.perf_counter() - start
+
+
+def _on_query(sql, seconds, rowcount):
+    t = _timings()
+    if t is not None:
+        t["queries"] += 1
+        t["db"] += seconds
+        t["rows"] += max(rowcount or 0, 0)
+
+
+def _before_render(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    start = g.pop("template_start", None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        t = _timings()
+        if t is not None:
+            t["tpl"] += elapsed
+        TEMPLATE_SECONDS.observe(template.name, elapsed)
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    if PROFILE_SLOW_MS and random.random() < PROFILE_SAMPLE:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _after_request(response):
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    route = request.endpoint or "unmatched"
+    t = _timings()
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        if total * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{route}-{int(time.time() * 1000)}.prof"))
+
+    REQUEST_SECONDS.observe(route, total)
+    DB_SECONDS.observe(route, t["db"])
+    DB_QUERIES.observe(route, t["queries"])
+
+    parts = []
+    db = g.get("db")
+    if db is not None:
+        parts.append(f"conn;dur={db.checkout_seconds * 1000:.2f}")
+    if t["queries"]:
+        parts.append(f'db;dur={t["db"] * 1000:.2f};desc="{t["queries"]} queries, {t["rows"]} rows"')
+    if t["tpl"]:
+        parts.append(f"tpl;dur={t['tpl'] * 1000:.2f}")
+    for name, value in t.items():
+        if name not in ("queries", "db", "rows", "tpl"):
+            parts.append(f"{name};dur={value * 1000:.2f}")
+    parts.append(f"total;dur={total * 1000:.2f}")
+    response.headers["Server-Timing"] = ", ".join(parts)
+    return response
+
+
+def metrics():
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not METRICS_TOKEN or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        abort(404)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    database.query_hooks.append(_on_query)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
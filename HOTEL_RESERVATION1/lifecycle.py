@@ -0,0 +1,141 @@
+"""
+Process lifecycle for production serving: health checks, schema check and
+graceful drain.
+
+    GET /healthz   liveness: 200 as long as the worker answers at all
+    GET /readyz    readiness: 503 while draining, while migrations are pending
+                   or when no database connection can be had
+
+Serving never runs DDL. Apply migrations as a separate release step
+(python migrations.py); until then /readyz lists the pending versions and the
+load balancer keeps the new workers out of rotation.
+
+On SIGTERM a worker first fails /readyz and closes its event streams, keeps
+serving for DRAIN_GRACE seconds so the load balancer can take it out, and only
+then stops accepting (see gunicorn.conf.py). In-flight requests finish, after
+which shutdown() flushes the audit log, stops the background threads and
+closes pooled connections.
+"""
+import os
+import signal
+import threading
+import time
+
+import MySQLdb
+from flask import Blueprint, g, jsonify
+
+import audit
+import availability
+import database
+import instrumentation
+import sweeper
+from events import bus
+from migrations import pending
+
+DRAIN_GRACE   = float(os.environ.get("DRAIN_GRACE", 5))
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", 30))
+
+health = Blueprint("health", __name__)
+
+
+class _State:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.draining = False
+        self.in_flight = 0
+        self.pending = None     # migrations not applied yet; None until checked
+        self.started = time.time()
+
+    def enter(self):
+        g.in_flight = True
+        with self._lock:
+            self.in_flight += 1
+
+    def leave(self, exc=None):
+        # teardown also runs for requests an earlier before_request cut short
+        if g.pop("in_flight", False):
+            with self._lock:
+                self.in_flight -= 1
+
+
+state = _State()
+instrumentation.METRICS += [
+    instrumentation.Gauge("hotel_requests_in_flight", "Requests being served by this worker.",
+                          lambda: state.in_flight),
+    instrumentation.Gauge("hotel_draining", "1 once this worker has been asked to stop.",
+                          lambda: int(state.draining)),
+]
+
+
+def check_schema(db=None):
+    """Records (and returns) the migrations not yet applied; never changes the schema."""
+    own = db is None
+    db = db or database.get_db()
+    try:
+        state.pending = pending(db)
+    finally:
+        if own:
+            db.close()
+    if state.pending:
+        print(f"Schema is behind: migrations {state.pending} pending; run python migrations.py")
+    return state.pending
+
+
+@health.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "pid": os.getpid(), "uptime_s": round(time.time() - state.started, 1)})
+
+
+@health.route("/readyz")
+def readyz():
+    if state.draining:
+        return jsonify({"status": "draining"}), 503
+    try:
+        if state.pending is None or state.pending:
+            check_schema()
+        else:
+            db = database.get_db()
+            cur = db.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            cur.close(); db.close()
+    except (MySQLdb.Error, database.PoolExhausted) as e:
+        return jsonify({"status": "unavailable", "message": f"Database: {e}"}), 503
+    if state.pending:
+        return jsonify({"status": "migrations_pending", "pending": state.pending}), 503
+    return jsonify({"status": "ready"})
+
+
+def begin_drain():
+    """Fails readiness and ends event streams; requests keep being served."""
+    if not state.draining:
+        state.draining = True
+        bus.close()
+
+
+def shutdown():
+    """Releases everything the worker holds; call once it has stopped accepting requests."""
+    begin_drain()
+    sweeper.sweeper.stop()
+    availability.refresher.stop()
+    audit.writer.close()
+    database.pool.clear()
+
+
+def on_sigterm(stop, grace=DRAIN_GRACE):
+    """
+    Installs a SIGTERM handler that starts draining at once and calls stop()
+    (the server's own "stop accepting" step) grace seconds later.
+    """
+    def handler(signum, frame):
+        begin_drain()
+        timer = threading.Timer(grace, stop)
+        timer.daemon = True
+        timer.start()
+    signal.signal(signal.SIGTERM, handler)
+
+
+def init_app(app):
+    app.before_request(state.enter)
+    app.teardown_request(state.leave)
+    app.register_blueprint(health)
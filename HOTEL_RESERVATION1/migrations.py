@@ -0,0 +1,352 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once and is recorded in schema_migrations. MySQL commits
+DDL implicitly, so keep every step safe to re-run by hand if a migration dies
+halfway. Add new migrations at the end of MIGRATIONS; never edit applied ones.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --explain  # check that the hot queries use an index
+
+tests/test_queries.py runs the same EXPLAINs and asserts which index each
+hot query uses.
+"""
+import sys
+from datetime import date, timedelta
+
+from database import get_db, create_database
+
+BASELINE = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(150) NOT NULL,
+        address VARCHAR(255),
+        age INT,
+        contact VARCHAR(20),
+        email VARCHAR(150) UNIQUE,
+        password_hash VARCHAR(255) NOT NULL,
+        is_admin TINYINT(1) DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rooms (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        number INT NOT NULL UNIQUE,
+        status VARCHAR(20) DEFAULT 'vacant',
+        booked_by INT,
+        check_in VARCHAR(100),
+        check_out VARCHAR(100),
+        room_type VARCHAR(50),
+        floor INT,
+        payment_status ENUM('Pending','Paid') DEFAULT 'Pending',
+        FOREIGN KEY (booked_by) REFERENCES users(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bookings (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        room_id INT NOT NULL,
+        user_id INT,
+        check_in DATE NOT NULL,
+        check_out DATE NOT NULL,
+        status ENUM('booked','cancelled','completed') DEFAULT 'booked',
+        payment_status ENUM('Pending','Paid') DEFAULT 'Pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_bookings_room_dates (room_id, check_in, check_out),
+        INDEX idx_bookings_dates (check_in, check_out),
+        INDEX idx_bookings_user (user_id, status),
+        FOREIGN KEY (room_id) REFERENCES rooms(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS manager_actions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        manager_id INT NOT NULL,
+        action_type VARCHAR(50) NOT NULL,
+        booking_id INT DEFAULT NULL,
+        user_id INT DEFAULT NULL,
+        description TEXT,
+        action_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (manager_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (booking_id) REFERENCES bookings(id) ON DELETE SET NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;
+    """,
+]
+
+
+def _legacy_stays(cur):
+    """
+    Stays kept on the rooms row itself, from before the bookings table:
+    [(room_id, user_id, check_in, check_out, payment_status)]. The VARCHAR dates
+    are parsed; a stay without a usable check-out is taken to last one night.
+    """
+    from reservations import parse_date
+
+    cur.execute("""
+        SELECT id, booked_by, check_in, check_out, payment_status FROM rooms
+         WHERE booked_by IS NOT NULL AND check_in IS NOT NULL
+    """)
+    stays = []
+    for room_id, user_id, check_in, check_out, payment_status in cur.fetchall():
+        try:
+            start = parse_date(check_in)
+        except ValueError:
+            print(f"Skipping the legacy stay in room id {room_id}: bad check-in {check_in!r}")
+            continue
+        try:
+            end = parse_date(check_out)
+        except ValueError:
+            end = None
+        if end is None or end <= start:
+            end = start + timedelta(days=1)
+        stays.append((room_id, user_id, start, end, payment_status or "Pending"))
+    return stays
+
+
+def _copy_legacy_stays(cur):
+    """One bookings row per legacy stay, unless it was copied already."""
+    today = date.today()
+    for room_id, user_id, check_in, check_out, payment_status in _legacy_stays(cur):
+        cur.execute("SELECT 1 FROM bookings WHERE room_id=%s AND check_in=%s AND check_out=%s",
+                    (room_id, check_in, check_out))
+        if cur.fetchone():
+            continue
+        cur.execute("""
+            INSERT INTO bookings (room_id, user_id, check_in, check_out, status, payment_status)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (room_id, user_id, check_in, check_out,
+              "completed" if check_out <= today else "booked", payment_status))
+
+
+def _point_action_fk_at_bookings(cur):
+    """Databases created before the bookings table have manager_actions.booking_id -> rooms(id)."""
+    cur.execute("""
+        SELECT CONSTRAINT_NAME, REFERENCED_TABLE_NAME
+          FROM information_schema.KEY_COLUMN_USAGE
+         WHERE TABLE_SCHEMA = DATABASE()
+           AND TABLE_NAME = 'manager_actions'
+           AND COLUMN_NAME = 'booking_id'
+           AND REFERENCED_TABLE_NAME IS NOT NULL
+    """)
+    constraints = cur.fetchall()
+    if any(table == "bookings" for _, table in constraints):
+        return
+    for name, _ in constraints:
+        cur.execute(f"ALTER TABLE manager_actions DROP FOREIGN KEY `{name}`")
+
+    # the old ids were room ids: point them at the stay _copy_legacy_stays() made for
+    # that room and guest; actions about earlier stays of the room can't be told apart
+    stays = {}
+    for room_id, user_id, check_in, check_out, _ in _legacy_stays(cur):
+        cur.execute("SELECT id FROM bookings WHERE room_id=%s AND check_in=%s AND check_out=%s",
+                    (room_id, check_in, check_out))
+        row = cur.fetchone()
+        if row:
+            stays[room_id] = (user_id, row[0])
+    cur.execute("SELECT id, booking_id, user_id FROM manager_actions WHERE booking_id IS NOT NULL")
+    remapped = []
+    for action_id, room_id, user_id in cur.fetchall():
+        guest, booking_id = stays.get(room_id, (None, None))
+        if user_id is not None and user_id != guest:
+            booking_id = None
+        remapped.append((booking_id, action_id))
+    if remapped:
+        cur.executemany("UPDATE manager_actions SET booking_id=%s WHERE id=%s", remapped)
+
+    cur.execute("""
+        ALTER TABLE manager_actions
+          ADD CONSTRAINT fk_actions_booking FOREIGN KEY (booking_id)
+              REFERENCES bookings(id) ON DELETE SET NULL
+    """)
+
+
+def backfill_analytics(cur):
+    """Seeds the rollups from the bookings already in the database."""
+    from analytics import backfill
+    backfill(cur.connection)
+
+
+# (version, description, [SQL strings or callables taking a cursor])
+MIGRATIONS = [
+    (1, "baseline schema", BASELINE),
+    (2, "legacy stays move to bookings", [_copy_legacy_stays, _point_action_fk_at_bookings]),
+    (3, "secondary indexes for hot lookups", [
+        "CREATE INDEX idx_actions_time ON manager_actions (action_time)",
+        "CREATE INDEX idx_bookings_status_checkin ON bookings (status, check_in)",
+        "CREATE INDEX idx_rooms_type_floor ON rooms (room_type, floor, number)",
+        "CREATE INDEX idx_rooms_status ON rooms (status)",
+    ]),
+    (4, "normalized lowercase email", [
+        """
+        ALTER TABLE users
+          ADD COLUMN email_normalized VARCHAR(150)
+              GENERATED ALWAYS AS (LOWER(email)) STORED
+        """,
+        "CREATE INDEX idx_users_email_normalized ON users (email_normalized)",
+    ]),
+    (5, "one-time codes shared between workers", [
+        """
+        CREATE TABLE IF NOT EXISTS otp_codes (
+            user_id INT NOT NULL,
+            purpose VARCHAR(20) NOT NULL,
+            code CHAR(6) NOT NULL,
+            expires_at DATETIME NOT NULL,
+            attempts TINYINT UNSIGNED NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, purpose),
+            INDEX idx_otp_codes_expires (expires_at)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS otp_issues (
+            user_id INT PRIMARY KEY,
+            window_start DATETIME NOT NULL,
+            issued INT NOT NULL DEFAULT 0,
+            INDEX idx_otp_issues_window (window_start)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (6, "server-side sessions", [
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id BINARY(32) PRIMARY KEY,
+            user_id INT NULL,
+            data TEXT,
+            expires_at DATETIME NOT NULL,
+            INDEX idx_sessions_user (user_id),
+            INDEX idx_sessions_expires (expires_at),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB
+        """,
+    ]),
+    (7, "daily analytics rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_occupancy (
+            day DATE NOT NULL,
+            room_type VARCHAR(50) NOT NULL,
+            floor INT NOT NULL,
+            room_nights INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, room_type, floor)
+        ) ENGINE=InnoDB
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_bookings (
+            day DATE NOT NULL,
+            room_type VARCHAR(50) NOT NULL,
+            created INT NOT NULL DEFAULT 0,
+            nights INT NOT NULL DEFAULT 0,
+            cancelled INT NOT NULL DEFAULT 0,
+            paid INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, room_type)
+        ) ENGINE=InnoDB
+        """,
+        backfill_analytics,
+    ]),
+    (8, "stay-expiry sweeper", [
+        "CREATE INDEX idx_bookings_status_checkout ON bookings (status, check_out)",
+        # background jobs log actions without a manager
+        "ALTER TABLE manager_actions MODIFY manager_id INT NULL",
+    ]),
+    (9, "room capacity for search", [
+        "ALTER TABLE rooms ADD COLUMN capacity INT NOT NULL DEFAULT 2",
+        "UPDATE rooms SET capacity = CASE room_type WHEN 'Family' THEN 4 WHEN 'Executive' THEN 3 ELSE 2 END",
+    ]),
+    (10, "unique normalized email, no index on the legacy rooms.status", [
+        # nothing filters on rooms.status since stays moved to bookings
+        "DROP INDEX idx_rooms_status ON rooms",
+        # login and register look users up by it, and it must name one account
+        "DROP INDEX idx_users_email_normalized ON users",
+        "CREATE UNIQUE INDEX idx_users_email_normalized ON users (email_normalized)",
+    ]),
+]
+
+
+def migrate(db, verbose=False):
+    cur = db.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+
+    for version, description, steps in MIGRATIONS:
+        if version in applied:
+            continue
+        if verbose:
+            print(f"Applying migration {version}: {description}")
+        for step in steps:
+            if callable(step):
+                step(cur)
+            else:
+                cur.execute(step)
+        cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description))
+        db.commit()
+    cur.close()
+
+
+def pending(db):
+    """Versions not yet applied; used to check the schema without changing it."""
+    cur = db.cursor()
+    try:
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+    except Exception:
+        applied = set()
+    finally:
+        cur.close()
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+# (name, query, params) for the lookups on the request path
+HOT_QUERIES = [
+    ("login", "SELECT id, name, password_hash, is_admin FROM users WHERE email_normalized=%s",
+     ("admin@example.com",)),
+    ("user_booking", """SELECT b.id FROM bookings b WHERE b.user_id=%s AND b.status='booked'
+                        AND b.payment_status='Pending' ORDER BY b.id DESC LIMIT 1""", (1,)),
+    ("room_overlap", """SELECT 1 FROM bookings WHERE room_id=%s AND status='booked'
+                        AND check_in < %s AND check_out > %s LIMIT 1""", (1, "2030-01-05", "2030-01-01")),
+    ("recent_actions", "SELECT id FROM manager_actions ORDER BY action_time DESC LIMIT 10", ()),
+    ("active_bookings", "SELECT id FROM bookings WHERE status='booked' AND check_in >= %s", ("2030-01-01",)),
+    ("expired_stays", "SELECT id FROM bookings WHERE status='booked' AND check_out <= %s ORDER BY check_out LIMIT 200",
+     ("2030-01-01",)),
+    ("rooms_by_type", "SELECT number FROM rooms WHERE room_type=%s AND floor=%s", ("Deluxe", 2)),
+]
+
+
+def explain_hot_queries(db):
+    """Returns [(name, table, key)] for every hot query; key is None on a full scan."""
+    cur = db.cursor()
+    report = []
+    for name, sql, params in HOT_QUERIES:
+        cur.execute("EXPLAIN " + sql, params)
+        columns = [d[0] for d in cur.description]
+        for row in cur.fetchall():
+            plan = dict(zip(columns, row))
+            key = plan.get("key")
+            if plan.get("type") == "ALL":
+                key = None
+            report.append((name, plan.get("table"), key))
+    cur.close()
+    return report
+
+
+if __name__ == "__main__":
+    create_database()
+    db = get_db()
+    migrate(db, verbose=True)
+    if "--explain" in sys.argv:
+        missing = False
+        for name, table, key in explain_hot_queries(db):
+            print(f"{name:16} {table:16} {key or 'FULL SCAN'}")
+            missing = missing or key is None
+        db.close()
+        sys.exit(1 if missing else 0)
+    db.close()
@@ -0,0 +1,234 @@
+"""
+Short-lived one-time codes (payment OTPs) with expiry and rate limiting.
+
+    code = otp.store.issue(user_id, "payment")        # may raise RateLimited
+    otp.store.verify(user_id, "payment", code)        # True once, then consumed
+
+A code lives for OTP_TTL seconds and is burned after OTP_MAX_ATTEMPTS wrong
+guesses; a user may request at most OTP_MAX_ISSUES codes per OTP_WINDOW
+seconds. OTP_BACKEND picks where codes live:
+
+    memory  per-process dict (default; single worker only)
+    redis   shared through REDIS_URL, expiry handled by Redis
+    db      otp_codes / otp_issues tables, expired rows swept periodically
+"""
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_db, transaction
+
+TTL            = int(os.environ.get("OTP_TTL", 300))
+MAX_ATTEMPTS   = int(os.environ.get("OTP_MAX_ATTEMPTS", 5))
+MAX_ISSUES     = int(os.environ.get("OTP_MAX_ISSUES", 5))
+WINDOW         = int(os.environ.get("OTP_WINDOW", 300))
+MAX_ENTRIES    = int(os.environ.get("OTP_MAX_ENTRIES", 100000))
+SWEEP_INTERVAL = int(os.environ.get("OTP_SWEEP_INTERVAL", 60))
+DIGITS         = 6
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many codes requested; try again in {retry_after} s.")
+        self.retry_after = retry_after
+
+
+def new_code():
+    return str(secrets.randbelow(10 ** DIGITS)).zfill(DIGITS)
+
+
+def codes_match(expected, given):
+    return hmac.compare_digest(str(expected).encode(), str(given or "").encode())
+
+
+class _Entry:
+    __slots__ = ("code", "expires", "attempts")
+
+    def __init__(self, code, expires):
+        self.code, self.expires, self.attempts = code, expires, 0
+
+
+class MemoryStore:
+    """
+    Both maps are kept in expiry order (every write moves the key to the end
+    and all entries share one lifetime), so sweeping only ever looks at the
+    front of each OrderedDict.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._codes = OrderedDict()   # "user:purpose" -> _Entry
+        self._issues = OrderedDict()  # user_id -> [window_start, count]
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        while self._codes:
+            key, entry = next(iter(self._codes.items()))
+            # runs before issue() adds its code, so leave room for it
+            if entry.expires > now and len(self._codes) < self.max_entries:
+                break
+            del self._codes[key]
+        while self._issues:
+            user_id, (start, _) = next(iter(self._issues.items()))
+            if start + WINDOW > now:
+                break
+            del self._issues[user_id]
+
+    def issue(self, user_id, purpose):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            window = self._issues.get(user_id)
+            if window is None:
+                window = self._issues[user_id] = [now, 0]
+            if window[1] >= MAX_ISSUES:
+                raise RateLimited(int(window[0] + WINDOW - now) + 1)
+            window[1] += 1
+            code = new_code()
+            key = f"{user_id}:{purpose}"
+            self._codes.pop(key, None)
+            self._codes[key] = _Entry(code, now + TTL)
+            return code
+
+    def verify(self, user_id, purpose, code):
+        key = f"{user_id}:{purpose}"
+        with self._lock:
+            entry = self._codes.get(key)
+            if entry is None or entry.expires <= time.monotonic():
+                self._codes.pop(key, None)
+                return False
+            if codes_match(entry.code, code):
+                del self._codes[key]
+                return True
+            entry.attempts += 1
+            if entry.attempts >= MAX_ATTEMPTS:
+                del self._codes[key]
+            return False
+
+
+class RedisStore:
+    def __init__(self, url, prefix="hotel:otp:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def issue(self, user_id, purpose):
+        issues_key = f"{self.prefix}issues:{user_id}"
+        pipe = self._redis.pipeline()
+        pipe.incr(issues_key)
+        pipe.expire(issues_key, WINDOW, nx=True)
+        pipe.ttl(issues_key)
+        count, _, remaining = pipe.execute()
+        if count > MAX_ISSUES:
+            raise RateLimited(max(remaining, 1))
+        code = new_code()
+        key = f"{self.prefix}{user_id}:{purpose}"
+        pipe = self._redis.pipeline()
+        pipe.setex(key, TTL, code)
+        pipe.delete(key + ":attempts")
+        pipe.execute()
+        return code
+
+    def verify(self, user_id, purpose, code):
+        key = f"{self.prefix}{user_id}:{purpose}"
+        stored = self._redis.get(key)
+        if stored is None:
+            return False
+        if codes_match(stored, code):
+            # only the request whose DEL removed the key gets to use the code
+            return self._redis.delete(key) == 1
+        attempts = self._redis.incr(key + ":attempts")
+        self._redis.expire(key + ":attempts", TTL)
+        if attempts >= MAX_ATTEMPTS:
+            self._redis.delete(key, key + ":attempts")
+        return False
+
+
+class DbStore:
+    """Uses the otp_codes/otp_issues tables (migration 5)."""
+
+    def __init__(self, sweep_interval=SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+
+    def _maybe_sweep(self, cur):
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        cur.execute("DELETE FROM otp_codes WHERE expires_at < NOW() LIMIT 1000")
+        cur.execute("DELETE FROM otp_issues WHERE window_start < NOW() - INTERVAL %s SECOND LIMIT 1000",
+                    (WINDOW,))
+
+    def issue(self, user_id, purpose):
+        db = get_db()
+        cur = db.cursor()
+        try:
+            with transaction(db):
+                # issued is assigned first, so both IFs still see the old window_start
+                cur.execute("""
+                    INSERT INTO otp_issues (user_id, window_start, issued) VALUES (%s, NOW(), 1)
+                    ON DUPLICATE KEY UPDATE
+                        issued = IF(window_start < NOW() - INTERVAL %s SECOND, 1, issued + 1),
+                        window_start = IF(window_start < NOW() - INTERVAL %s SECOND, NOW(), window_start)
+                """, (user_id, WINDOW, WINDOW))
+                cur.execute("""
+                    SELECT issued, TIMESTAMPDIFF(SECOND, NOW(), window_start + INTERVAL %s SECOND)
+                      FROM otp_issues WHERE user_id=%s
+                """, (WINDOW, user_id))
+                issued, remaining = cur.fetchone()
+                if issued > MAX_ISSUES:
+                    raise RateLimited(max(remaining, 1))
+                code = new_code()
+                cur.execute("""
+                    REPLACE INTO otp_codes (user_id, purpose, code, expires_at, attempts)
+                    VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND, 0)
+                """, (user_id, purpose, code, TTL))
+            self._maybe_sweep(cur)
+            return code
+        finally:
+            cur.close(); db.close()
+
+    def verify(self, user_id, purpose, code):
+        import MySQLdb
+        db = get_db()
+        cur = db.cursor()
+        try:
+            with transaction(db):
+                cur.execute("""
+                    SELECT code, attempts FROM otp_codes
+                     WHERE user_id=%s AND purpose=%s AND expires_at > NOW()
+                     FOR UPDATE
+                """, (user_id, purpose))
+                row = cur.fetchone()
+                if row is None:
+                    return False
+                if codes_match(row[0], code):
+                    cur.execute("DELETE FROM otp_codes WHERE user_id=%s AND purpose=%s", (user_id, purpose))
+                    return True
+                if row[1] + 1 >= MAX_ATTEMPTS:
+                    cur.execute("DELETE FROM otp_codes WHERE user_id=%s AND purpose=%s", (user_id, purpose))
+                else:
+                    cur.execute("UPDATE otp_codes SET attempts = attempts + 1 WHERE user_id=%s AND purpose=%s",
+                                (user_id, purpose))
+                return False
+        except MySQLdb.Error as e:
+            print("Error verifying OTP:", e)
+            return False
+        finally:
+            cur.close(); db.close()
+
+
+def _make_store():
+    backend = os.environ.get("OTP_BACKEND", "memory").lower()
+    if backend == "redis":
+        return RedisStore(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    if backend == "db":
+        return DbStore()
+    return MemoryStore()
+
+
+store = _make_store()
@@ -0,0 +1,133 @@
+"""
+Password hashing and verification.
+
+Hashes are produced with PASSWORD_METHOD (any werkzeug method string). A
+successful login against a legacy unsalted MD5 hash or a hash made with other
+parameters returns a fresh hash for the caller to store, so old credentials are
+upgraded as users come back.
+
+The KDF runs in a pool of HASH_WORKERS threads (hashlib releases the GIL while
+hashing). The pool only caps how many hashes run at once: the request thread
+still blocks until its own hash is done. At most HASH_QUEUE hashes may be in
+flight or waiting; beyond that callers wait up to HASH_WAIT seconds and then
+get Busy, which login turns into a 503 instead of letting a burst of logins
+pile up behind the CPU.
+"""
+import concurrent.futures
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import instrumentation
+
+PASSWORD_METHOD = os.environ.get("PASSWORD_METHOD", "scrypt:32768:8:1")
+HASH_WORKERS    = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 2))
+HASH_QUEUE      = int(os.environ.get("HASH_QUEUE", HASH_WORKERS * 4))
+HASH_WAIT       = float(os.environ.get("HASH_WAIT", 2.0))
+
+_MD5 = re.compile(r"^[0-9a-f]{32}$")
+# werkzeug fills in defaults ("pbkdf2:sha256" is stored as "pbkdf2:sha256:600000"),
+# so compare against what PASSWORD_METHOD actually produces
+METHOD_PREFIX = generate_password_hash("", PASSWORD_METHOD).split("$", 1)[0]
+
+HASH_SECONDS = instrumentation.Histogram(
+    "hotel_password_hash_seconds", "Time spent in the password KDF.", label="op")
+
+
+class Busy(Exception):
+    pass
+
+
+class _Pool:
+    def __init__(self, workers=HASH_WORKERS, queue=HASH_QUEUE):
+        self._executor = None
+        self._pid = None
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(queue)
+        self._lock = threading.Lock()
+        self.depth = 0
+        self.rehashed = 0
+
+    def _ensure_started(self):
+        # a forked worker can't use the parent's threads
+        if self._pid != os.getpid():
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="kdf")
+            self._pid = os.getpid()
+
+    def run(self, op, fn, *args):
+        """Runs fn(*args) on a pool thread and waits for it; raises Busy if no slot frees up."""
+        if not self._slots.acquire(timeout=HASH_WAIT):
+            raise Busy("Too many logins in progress, please retry.")
+        with self._lock:
+            self._ensure_started()
+            self.depth += 1
+        try:
+            start = time.perf_counter()
+            result = self._executor.submit(fn, *args).result()
+            HASH_SECONDS.observe(op, time.perf_counter() - start)
+            return result
+        finally:
+            with self._lock:
+                self.depth -= 1
+            self._slots.release()
+
+    def count_rehash(self):
+        with self._lock:
+            self.rehashed += 1
+
+
+pool = _Pool()
+instrumentation.METRICS += [
+    HASH_SECONDS,
+    instrumentation.Gauge("hotel_password_hash_queue_depth",
+                          "Hashes running or waiting for a KDF thread.", lambda: pool.depth),
+    instrumentation.Gauge("hotel_password_rehashes",
+                          "Stored hashes upgraded at login by this process.", lambda: pool.rehashed),
+]
+
+
+def is_legacy(stored):
+    return bool(_MD5.match(stored or ""))
+
+
+def needs_rehash(stored):
+    return is_legacy(stored) or stored.split("$", 1)[0] != METHOD_PREFIX
+
+
+def hash_password(password):
+    return pool.run("hash", generate_password_hash, password, PASSWORD_METHOD)
+
+
+def _check(stored, password):
+    if is_legacy(stored):
+        return hmac.compare_digest(stored, hashlib.md5(password.encode()).hexdigest())
+    return check_password_hash(stored, password)
+
+
+def _check_and_rehash(stored, password):
+    if not _check(stored, password):
+        return False, None
+    if needs_rehash(stored):
+        return True, generate_password_hash(password, PASSWORD_METHOD)
+    return True, None
+
+
+def verify(stored, password):
+    """
+    Returns (ok, new_hash). new_hash is set when the password was right but the
+    stored hash is legacy or outdated; the caller should save it.
+    """
+    return pool.run("verify", _check_and_rehash, stored, password)
+
+
+def save_rehash(cur, user_id, old_hash, new_hash):
+    # conditional so a password changed meanwhile isn't overwritten
+    cur.execute("UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s",
+                (new_hash, user_id, old_hash))
+    if cur.rowcount:
+        pool.count_rehash()
@@ -0,0 +1,232 @@
+"""
+Date-range reservation engine on top of the `bookings` table.
+
+A booking occupies the nights [check_in, check_out); two stays overlap when
+  existing.check_in < new.check_out AND existing.check_out > new.check_in
+which MySQL resolves with a range scan on idx_bookings_room_dates.
+
+Writers go through reserve()/move_booking()/cancel_booking()/mark_paid()
+inside database.transaction(): the target room row is locked with
+SELECT ... FOR UPDATE first, so two requests for the same room serialise and
+the loser sees the winner's stay. Each of them also updates the analytics
+rollups and the in-memory availability index once the transaction commits.
+
+reserve_group() books `count` rooms of one type in a single transaction. It
+locks every room of that type (in room-number order, so two group bookings
+can't deadlock), picks free rooms according to an allocation policy and
+either books all of them or raises RoomUnavailable and books none.
+"""
+import os
+from datetime import datetime
+from itertools import groupby
+
+import analytics
+import availability
+import http_cache
+
+ACTIVE = "booked"
+
+# allocation policies for reserve_group()
+ADJACENT   = "adjacent"     # consecutive room numbers on one floor
+SAME_FLOOR = "same_floor"   # any rooms on one floor
+ANY        = "any"          # as few floors as possible
+POLICIES   = (ADJACENT, SAME_FLOOR, ANY)
+MAX_GROUP_SIZE = int(os.environ.get("MAX_GROUP_SIZE", 20))
+
+
+class RoomUnavailable(Exception):
+    pass
+
+
+def parse_date(value):
+    """
+    Accepts 'YYYY-MM-DD' (or a datetime-local value, the time part is ignored)
+    and returns a date. Raises ValueError.
+    """
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Invalid date format.")
+
+
+def parse_stay(check_in, check_out):
+    """Returns (check_in, check_out) as dates. Raises ValueError."""
+    start, end = parse_date(check_in), parse_date(check_out)
+    if end <= start:
+        raise ValueError("Check-out must be after check-in.")
+    return start, end
+
+
+def room_is_free(cur, room_id, check_in, check_out, exclude_booking_id=None):
+    sql = """
+        SELECT 1 FROM bookings
+         WHERE room_id=%s AND status=%s
+           AND check_in < %s AND check_out > %s
+    """
+    params = [room_id, ACTIVE, check_out, check_in]
+    if exclude_booking_id is not None:
+        sql += " AND id != %s"
+        params.append(exclude_booking_id)
+    cur.execute(sql + " LIMIT 1", params)
+    return cur.fetchone() is None
+
+
+def find_available_rooms(cur, check_in, check_out, room_type=None, floor=None, limit=None):
+    """Rooms with no active booking overlapping [check_in, check_out)."""
+    sql = """
+        SELECT r.id, r.number, r.room_type, r.floor
+          FROM rooms r
+         WHERE NOT EXISTS (
+                SELECT 1 FROM bookings b
+                 WHERE b.room_id = r.id AND b.status = %s
+                   AND b.check_in < %s AND b.check_out > %s)
+    """
+    params = [ACTIVE, check_out, check_in]
+    if room_type:
+        sql += " AND r.room_type=%s"
+        params.append(room_type)
+    if floor is not None:
+        sql += " AND r.floor=%s"
+        params.append(floor)
+    sql += " ORDER BY r.number"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+
+def create_booking(cur, room_id, user_id, check_in, check_out):
+    cur.execute("""
+        INSERT INTO bookings (room_id, user_id, check_in, check_out, status, payment_status)
+        VALUES (%s, %s, %s, %s, %s, 'Pending')
+    """, (room_id, user_id, check_in, check_out, ACTIVE))
+    return cur.lastrowid
+
+
+def lock_room(cur, room_id):
+    cur.execute("SELECT id FROM rooms WHERE id=%s FOR UPDATE", (room_id,))
+    return cur.fetchone() is not None
+
+
+def _record(cur, before, after):
+    analytics.record(cur, before, after)
+    availability.record(before, after)
+    http_cache.bump_on_commit("bookings")
+
+
+def reserve(cur, room_id, user_id, check_in, check_out):
+    """Books the room or raises RoomUnavailable. Call inside a transaction."""
+    lock_room(cur, room_id)
+    if not room_is_free(cur, room_id, check_in, check_out):
+        raise RoomUnavailable("Room is already booked for those dates.")
+    booking_id = create_booking(cur, room_id, user_id, check_in, check_out)
+    _record(cur, None, analytics.facts(cur, booking_id))
+    return booking_id
+
+
+def move_booking(cur, booking_id, room_id, check_in, check_out):
+    """Re-dates and/or re-rooms a booking or raises RoomUnavailable. Call inside a transaction."""
+    lock_room(cur, room_id)
+    if not room_is_free(cur, room_id, check_in, check_out, exclude_booking_id=booking_id):
+        raise RoomUnavailable("Room is already booked for those dates.")
+    before = analytics.facts(cur, booking_id)
+    cur.execute("""
+        UPDATE bookings
+        SET room_id=%s, check_in=%s, check_out=%s
+        WHERE id=%s
+    """, (room_id, check_in, check_out, booking_id))
+    _record(cur, before, analytics.facts(cur, booking_id))
+
+
+def cancel_booking(cur, booking_id):
+    """Cancels an active booking; False if it was not active. Call inside a transaction."""
+    before = analytics.facts(cur, booking_id)
+    cur.execute("UPDATE bookings SET status='cancelled' WHERE id=%s AND status=%s", (booking_id, ACTIVE))
+    if not cur.rowcount:
+        return False
+    _record(cur, before, dict(before, status="cancelled"))
+    return True
+
+
+def mark_paid(cur, booking_id, active_only=False):
+    """Marks a pending booking paid; False if it was already paid (or not active). Call inside a transaction."""
+    before = analytics.facts(cur, booking_id)
+    sql = "UPDATE bookings SET payment_status='Paid' WHERE id=%s AND payment_status='Pending'"
+    params = [booking_id]
+    if active_only:
+        sql += " AND status=%s"
+        params.append(ACTIVE)
+    cur.execute(sql, params)
+    if not cur.rowcount:
+        return False
+    _record(cur, before, dict(before, payment_status="Paid"))
+    return True
+
+
+def _by_floor(rooms):
+    """{floor: [rooms ordered by number]} for (id, number, room_type, floor) rows, lowest floor first."""
+    # rooms.floor is nullable; rooms without one (floor None) come after every real floor
+    rooms = sorted(rooms, key=lambda r: (r[3] is None, r[3] or 0, r[1]))
+    return {floor: list(group) for floor, group in groupby(rooms, key=lambda r: r[3])}
+
+
+def choose_rooms(rooms, count, policy=SAME_FLOOR):
+    """
+    Picks `count` of the free `rooms` according to `policy`, or returns None if
+    the policy can't be met. Lower floors and lower numbers win ties. Rooms
+    with no floor recorded are only used by ANY, since nothing says where
+    they are.
+    """
+    floors = _by_floor(rooms)
+    if policy in (ADJACENT, SAME_FLOOR):
+        floors.pop(None, None)
+    if policy == ADJACENT:
+        for group in floors.values():
+            run = []
+            for room in group:
+                run = run + [room] if run and room[1] == run[-1][1] + 1 else [room]
+                if len(run) == count:
+                    return run
+        return None
+    if policy == SAME_FLOOR:
+        for group in floors.values():
+            if len(group) >= count:
+                return group[:count]
+        return None
+    if policy == ANY:
+        if len(rooms) < count:
+            return None
+        # fullest floors first so the group is spread over as few floors as possible;
+        # rooms without a floor only make up what the known floors can't
+        chosen = []
+        for floor in sorted(floors, key=lambda f: (f is None, -len(floors[f]), f or 0)):
+            chosen += floors[floor][:count - len(chosen)]
+            if len(chosen) == count:
+                return chosen
+    raise ValueError(f"Unknown allocation policy: {policy}")
+
+
+def reserve_group(cur, user_id, room_type, count, check_in, check_out, policy=SAME_FLOOR):
+    """
+    Books `count` rooms of `room_type` for the same stay; returns
+    [(booking_id, room_number, floor)] or raises RoomUnavailable with nothing
+    booked. Call inside a transaction.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown allocation policy: {policy}")
+    cur.execute("SELECT id FROM rooms WHERE room_type=%s ORDER BY number FOR UPDATE", (room_type,))
+    total = len(cur.fetchall())
+    if total < count:
+        raise RoomUnavailable(f"There are only {total} {room_type} rooms.")
+
+    rooms = choose_rooms(find_available_rooms(cur, check_in, check_out, room_type), count, policy)
+    if rooms is None:
+        raise RoomUnavailable(f"Not enough {room_type} rooms free for those dates "
+                              f"({policy.replace('_', ' ')}).")
+    booked = []
+    for room_id, number, _, floor in rooms:
+        booking_id = create_booking(cur, room_id, user_id, check_in, check_out)
+        _record(cur, None, analytics.facts(cur, booking_id))
+        booked.append((booking_id, number, floor))
+    return booked
@@ -0,0 +1,289 @@
+"""
+Server-side sessions.
+
+The cookie carries only a random token; the session row (keyed by the token's
+SHA-256) holds the user id and any extra values such as flashed messages. The
+principal (user_id, user_name, is_admin) is read from the users table, so a
+role change or a deleted account takes effect without waiting for the cookie
+to expire, and is cached per session in a small in-process LRU:
+
+    revoke_user(user_id)      # log a user out everywhere
+    invalidate_user(user_id)  # re-read name/role on the next request
+    revoke_all()              # log everybody out
+
+Other workers pick up a role change within SESSION_CACHE_TTL seconds; revoked
+sessions are gone for all of them at once since every request looks its row up.
+Static files, health checks and /metrics (SESSIONLESS_PATHS) never read the
+session, so they get a null session and skip the lookup.
+
+SESSION_BACKEND selects db (sessions table, default), redis (REDIS_URL) or
+cookie (Flask's signed cookie, no server-side state).
+
+    python session_store.py --revoke-all
+    python session_store.py --revoke-user 42
+"""
+import hashlib
+import os
+import secrets
+import sys
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from cache import MemoryBackend
+from database import get_db
+
+CACHE_TTL      = int(os.environ.get("SESSION_CACHE_TTL", 30))
+CACHE_ENTRIES  = int(os.environ.get("SESSION_CACHE_ENTRIES", 10000))
+SWEEP_INTERVAL = int(os.environ.get("SESSION_SWEEP_INTERVAL", 300))
+
+PRINCIPAL_KEYS = ("user_id", "user_name", "is_admin")
+
+# request paths answered without a session; prefixes of request.path
+SESSIONLESS_PATHS = ("/static/", "/assets/", "/healthz", "/readyz", "/metrics")
+
+
+def _key(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, token=None, user_id=None, remaining=0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.token = token
+        self.loaded_user_id = user_id
+        self.remaining = remaining
+        self.modified = False
+
+
+class DbStore:
+    """Uses the sessions table (migration 6); rows go away with their user."""
+
+    def __init__(self, sweep_interval=SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+
+    def load(self, key):
+        db = get_db()
+        cur = db.cursor()
+        cur.execute("""
+            SELECT user_id, data, TIMESTAMPDIFF(SECOND, NOW(), expires_at)
+              FROM sessions WHERE id=%s AND expires_at > NOW()
+        """, (key,))
+        row = cur.fetchone()
+        cur.close(); db.close()
+        return row
+
+    def save(self, key, user_id, data, ttl):
+        db = get_db()
+        cur = db.cursor()
+        cur.execute("""
+            INSERT INTO sessions (id, user_id, data, expires_at)
+            VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE user_id=VALUES(user_id), data=VALUES(data),
+                                    expires_at=VALUES(expires_at)
+        """, (key, user_id, data, ttl))
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            cur.execute("DELETE FROM sessions WHERE expires_at < NOW() LIMIT 1000")
+        db.commit()
+        cur.close(); db.close()
+
+    def _execute(self, sql, params=()):
+        db = get_db()
+        cur = db.cursor()
+        cur.execute(sql, params)
+        db.commit()
+        cur.close(); db.close()
+
+    def delete(self, key):
+        self._execute("DELETE FROM sessions WHERE id=%s", (key,))
+
+    def revoke_user(self, user_id):
+        self._execute("DELETE FROM sessions WHERE user_id=%s", (user_id,))
+
+    def revoke_all(self):
+        self._execute("TRUNCATE TABLE sessions")
+
+
+class RedisStore:
+    def __init__(self, url, prefix="hotel:session:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _name(self, key):
+        return self.prefix + key.hex()
+
+    def load(self, key):
+        pipe = self._redis.pipeline()
+        pipe.hmget(self._name(key), "user_id", "data")
+        pipe.ttl(self._name(key))
+        (user_id, data), remaining = pipe.execute()
+        if data is None:
+            return None
+        return (int(user_id) if user_id else None), data, remaining
+
+    def save(self, key, user_id, data, ttl):
+        name = self._name(key)
+        pipe = self._redis.pipeline()
+        pipe.delete(name)
+        pipe.hset(name, mapping={"user_id": user_id or "", "data": data})
+        pipe.expire(name, ttl)
+        if user_id is not None:
+            index = f"{self.prefix}user:{user_id}"
+            pipe.sadd(index, name)
+            pipe.expire(index, ttl)
+        pipe.execute()
+
+    def delete(self, key):
+        self._redis.delete(self._name(key))
+
+    def revoke_user(self, user_id):
+        index = f"{self.prefix}user:{user_id}"
+        names = self._redis.smembers(index)
+        self._redis.delete(index, *names)
+
+    def revoke_all(self):
+        for name in self._redis.scan_iter(self.prefix + "*"):
+            self._redis.delete(name)
+
+
+class PrincipalCache(MemoryBackend):
+    def delete_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (p, _) in self._data.items() if p["user_id"] == user_id]:
+                del self._data[key]
+
+
+def _load_principal(user_id):
+    db = get_db()
+    cur = db.cursor()
+    cur.execute("SELECT id, name, is_admin FROM users WHERE id=%s", (user_id,))
+    row = cur.fetchone()
+    cur.close(); db.close()
+    if row is None:
+        return None
+    return dict(zip(PRINCIPAL_KEYS, row))
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        # sessions open before URL matching, so go by the path rather than the endpoint
+        if request.path.startswith(SESSIONLESS_PATHS):
+            return self.make_null_session(app)
+        token = request.cookies.get(self.get_cookie_name(app))
+        if not token:
+            return ServerSession()
+        key = _key(token)
+        row = self.store.load(key)
+        if row is None:
+            return ServerSession()
+        user_id, data, remaining = row
+        session = ServerSession(self.serializer.loads(data) if data else None,
+                                token=token, user_id=user_id, remaining=remaining)
+        if user_id is not None:
+            principal = principals.get(key)
+            if principal is None:
+                principal = _load_principal(user_id)
+                if principal is None:
+                    self.store.delete(key)
+                    return ServerSession()
+                principals.set(key, principal, CACHE_TTL)
+            dict.update(session, principal)
+        return session
+
+    def _forget(self, token):
+        key = _key(token)
+        self.store.delete(key)
+        principals.delete(key)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        user_id = session.get("user_id")
+        data = {k: v for k, v in session.items() if k not in PRINCIPAL_KEYS}
+
+        # a new token on login/logout, so a token seen before login is worthless after it
+        rotated = session.token is not None and user_id != session.loaded_user_id
+        if rotated:
+            self._forget(session.token)
+
+        if user_id is None and not data:
+            if session.token is not None:
+                if not rotated:
+                    self._forget(session.token)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        if session.token is None or rotated:
+            session.token = secrets.token_urlsafe(32)
+        elif not session.modified and session.remaining > ttl // 2:
+            return
+        self.store.save(_key(session.token), user_id, self.serializer.dumps(data), ttl)
+        response.set_cookie(
+            name, session.token,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def _make_store():
+    backend = os.environ.get("SESSION_BACKEND", "db").lower()
+    if backend == "cookie":
+        return None
+    if backend == "redis":
+        return RedisStore(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    return DbStore()
+
+
+store = _make_store()
+principals = PrincipalCache(max_entries=CACHE_ENTRIES)
+
+
+def revoke_user(user_id):
+    if store is not None:
+        store.revoke_user(int(user_id))
+    principals.delete_user(int(user_id))
+
+
+def invalidate_user(user_id):
+    principals.delete_user(int(user_id))
+
+
+def revoke_all():
+    if store is not None:
+        store.revoke_all()
+    principals.clear()
+
+
+def init_app(app):
+    if store is not None:
+        app.session_interface = ServerSessionInterface(store)
+
+
+if __name__ == "__main__":
+    if "--revoke-all" in sys.argv:
+        revoke_all()
+        print("All sessions revoked.")
+    elif "--revoke-user" in sys.argv:
+        user_id = sys.argv[sys.argv.index("--revoke-user") + 1]
+        revoke_user(user_id)
+        print(f"Sessions of user {user_id} revoked.")
+    else:
+        print(__doc__)
@@ -0,0 +1,127 @@
+"""
+Background release of stays whose check-out date has passed.
+
+Every SWEEP_INTERVAL seconds active bookings with check_out <= today are marked
+'completed', SWEEP_BATCH rows per transaction. Each batch is found by a range
+scan on idx_bookings_status_checkout and only those rows are locked, so a sweep
+never blocks booking traffic for longer than one small batch. Every release
+gets an audit row ("auto_checkout", no manager) and a booking_completed event.
+
+Workers each run the loop, but a MySQL named lock lets only one of them sweep
+at a time. Run a single pass by hand with
+
+    python sweeper.py
+"""
+import os
+import threading
+from datetime import date
+
+from audit import log_manager_action
+import http_cache
+from cache import invalidate_counts
+from database import get_db, transaction
+from events import publish
+from reservations import ACTIVE
+
+SWEEP_ENABLED  = os.environ.get("SWEEP_ENABLED", "1") == "1"
+SWEEP_INTERVAL = float(os.environ.get("SWEEP_INTERVAL", 300))
+SWEEP_BATCH    = int(os.environ.get("SWEEP_BATCH", 200))
+LOCK_NAME      = "hotel_stay_sweeper"
+
+
+def _release_batch(db, today, batch_size):
+    """Completes up to batch_size expired stays in one transaction; returns the released rows."""
+    cur = db.cursor()
+    try:
+        with transaction(db):
+            cur.execute("""
+                SELECT b.id, b.user_id, r.number, r.room_type, b.check_out
+                  FROM bookings b JOIN rooms r ON b.room_id = r.id
+                 WHERE b.status=%s AND b.check_out <= %s
+                 ORDER BY b.check_out, b.id
+                 LIMIT %s
+                 FOR UPDATE
+            """, (ACTIVE, today, batch_size))
+            rows = cur.fetchall()
+            if rows:
+                # 'completed' nights still count as occupied, so the analytics rollups don't move
+                cur.execute("UPDATE bookings SET status='completed' WHERE id IN %s AND status=%s",
+                            ([r[0] for r in rows], ACTIVE))
+        return rows
+    finally:
+        cur.close()
+
+
+def sweep(today=None, batch_size=SWEEP_BATCH):
+    """Runs one full pass; returns how many bookings were released (None if another worker holds the lock)."""
+    today = today or date.today()
+    db = get_db()
+    cur = db.cursor()
+    try:
+        cur.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+        if not cur.fetchone()[0]:
+            return None
+        released = 0
+        try:
+            while True:
+                rows = _release_batch(db, today, batch_size)
+                for booking_id, user_id, number, room_type, check_out in rows:
+                    log_manager_action(
+                        None, "auto_checkout", booking_id=booking_id, user_id=user_id,
+                        description=f"Released Room {number} ({room_type}) after check-out {check_out}")
+                    publish("booking_completed", {"booking_id": booking_id, "room_number": number})
+                released += len(rows)
+                if len(rows) < batch_size:
+                    break
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cur.fetchall()
+        if released:
+            invalidate_counts()
+            http_cache.bump("bookings")
+        return released
+    finally:
+        cur.close(); db.close()
+
+
+class Sweeper:
+    def __init__(self, interval=SWEEP_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        # started lazily (and again after a fork) so every worker gets its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="stay-sweeper", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                sweep()
+            except Exception as e:
+                # keep the thread alive; the next interval tries again
+                print("Error sweeping expired stays:", e)
+
+    def stop(self):
+        self._stop.set()
+
+
+sweeper = Sweeper()
+
+
+def init_app(app):
+    if SWEEP_ENABLED:
+        app.before_request(sweeper.ensure_started)
+
+
+if __name__ == "__main__":
+    print(f"Released {sweep() or 0} expired stays.")
@@ -0,0 +1,58 @@
+"""
+Shared fixtures. The app modules import each other by top-level name, so the
+package directory goes on sys.path.
+
+Tests that need MySQL use the `db` fixture and are skipped when it can't
+connect; point DB_HOST/DB_PORT/DB_NAME at a scratch database, since they
+write rows of their own.
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    MySQLdb = pytest.importorskip("MySQLdb")
+    pytest.importorskip("flask")
+    import database
+
+    try:
+        conn = database.get_db()
+    except (MySQLdb.Error, database.PoolExhausted) as e:
+        pytest.skip(f"MySQL is not available: {e}")
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM bookings LIMIT 1")
+        cur.fetchall()
+    except MySQLdb.Error as e:
+        cur.close(); conn.close()
+        pytest.skip(f"The hotel schema is not set up: {e}")
+    cur.close()
+    yield conn
+    conn.close()
+
+
+class Clock:
+    """Stands in for time.monotonic(); tests move it with advance()."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # threading and queue keep their own reference, so timed waits are unaffected
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("flask")
+
+from admission import MemoryBuckets, _rate
+
+
+def test_burst_then_refused(clock):
+    buckets = MemoryBuckets()
+    for _ in range(3):
+        assert buckets.take("ip:1", 3, 2.0) == 0
+    assert buckets.take("ip:1", 3, 2.0) == pytest.approx(2.0)
+
+
+def test_refill_at_the_interval(clock):
+    buckets = MemoryBuckets()
+    for _ in range(3):
+        buckets.take("ip:1", 3, 2.0)
+    clock.advance(0.5)
+    assert buckets.take("ip:1", 3, 2.0) == pytest.approx(1.5)
+    clock.advance(1.5)
+    assert buckets.take("ip:1", 3, 2.0) == 0
+    assert buckets.take("ip:1", 3, 2.0) > 0
+    # a long pause refills the whole burst, never more
+    clock.advance(60)
+    for _ in range(3):
+        assert buckets.take("ip:1", 3, 2.0) == 0
+    assert buckets.take("ip:1", 3, 2.0) > 0
+
+
+def test_refusals_do_not_use_up_tokens(clock):
+    buckets = MemoryBuckets()
+    buckets.take("ip:1", 1, 1.0)
+    for _ in range(5):
+        assert buckets.take("ip:1", 1, 1.0) > 0
+    clock.advance(1.0)
+    assert buckets.take("ip:1", 1, 1.0) == 0
+
+
+def test_keys_are_independent(clock):
+    buckets = MemoryBuckets()
+    assert buckets.take("ip:1", 1, 10.0) == 0
+    assert buckets.take("ip:1", 1, 10.0) > 0
+    assert buckets.take("ip:2", 1, 10.0) == 0
+
+
+def test_full_buckets_are_forgotten(clock):
+    buckets = MemoryBuckets()
+    for i in range(5):
+        buckets.take(f"ip:{i}", 2, 1.0)
+    clock.advance(1.0)
+    buckets.take("ip:new", 2, 1.0)
+    assert list(buckets._full_at) == ["ip:new"]
+
+
+def test_least_recently_used_key_is_evicted(clock):
+    buckets = MemoryBuckets(max_keys=2)
+    buckets.take("a", 1, 60.0)
+    buckets.take("b", 1, 60.0)
+    buckets.take("c", 1, 60.0)
+    assert list(buckets._full_at) == ["b", "c"]
+    # "a" was dropped, so it starts from a full bucket again
+    assert buckets.take("a", 1, 60.0) == 0
+
+
+def test_rate(monkeypatch):
+    monkeypatch.setenv("ADMIT_TEST", "10/60")
+    assert _rate("ADMIT_TEST", "off") == (10, 6.0)
+    monkeypatch.setenv("ADMIT_TEST", "off")
+    assert _rate("ADMIT_TEST", "10/60") is None
+    monkeypatch.delenv("ADMIT_TEST")
+    assert _rate("ADMIT_TEST", "5/5") == (5, 1.0)
@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("flask")
+
+from availability import AvailabilityIndex, _bits
+
+DAY = date.today() + timedelta(days=10)
+
+# (id, number, room_type, floor, capacity)
+ROOMS = [
+    (11, 101, "Standard", 1, 2),
+    (12, 102, "Deluxe", 1, 3),
+    (13, 201, "Deluxe", 2, 4),
+    (14, 301, None, None, None),
+]
+
+
+class FakeDB:
+    """Answers the two SELECTs of AvailabilityIndex.load() in order."""
+
+    def __init__(self, rooms, stays, on_execute=None):
+        self.results = [rooms, stays]
+        self.on_execute = on_execute
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        if self.on_execute:
+            self.on_execute()
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def close(self):
+        pass
+
+
+def nights(n, start=DAY):
+    return start, start + timedelta(days=n)
+
+
+def numbers(rooms):
+    return [r["number"] for r in rooms]
+
+
+@pytest.fixture
+def index():
+    index = AvailabilityIndex()
+    # room 102 is booked for DAY+1 and DAY+2
+    index.load(FakeDB(ROOMS, [(12, DAY + timedelta(days=1), DAY + timedelta(days=3))]))
+    return index
+
+
+def test_bits():
+    assert list(_bits(0)) == []
+    assert list(_bits(0b101001)) == [0, 3, 5]
+    assert list(_bits(1 << 200)) == [200]
+
+
+def test_booked_nights_block_the_room(index):
+    assert numbers(index.search(*nights(1))[0]) == [101, 102, 201, 301]
+    assert numbers(index.search(*nights(2))[0]) == [101, 201, 301]
+    # the check-out day itself is free
+    assert numbers(index.search(*nights(1, DAY + timedelta(days=3)))[0]) == [101, 102, 201, 301]
+
+
+def test_filters(index):
+    assert numbers(index.search(*nights(1), room_type="Deluxe")[0]) == [102, 201]
+    assert numbers(index.search(*nights(1), floor=1)[0]) == [101, 102]
+    assert numbers(index.search(*nights(1), capacity=3)[0]) == [102, 201]
+    assert numbers(index.search(*nights(1), room_type="Suite")[0]) == []
+
+
+def test_facets_leave_out_their_own_filter(index):
+    _, facets = index.search(*nights(2), room_type="Deluxe", floor=1)
+    by_type = {f["value"]: f["count"] for f in facets["room_type"]}
+    by_floor = {f["value"]: f["count"] for f in facets["floor"]}
+    # floor 1 only: 101 is free, 102 is booked
+    assert by_type == {"Standard": 1, "Deluxe": 0, None: 0}
+    # Deluxe only: 201 is free
+    assert by_floor == {1: 0, 2: 1, None: 0}
+
+
+def test_apply_books_and_frees_nights(index):
+    index.apply(11, DAY, DAY + timedelta(days=2), True)
+    assert numbers(index.search(*nights(1, DAY + timedelta(days=1)))[0]) == [201, 301]
+    index.apply(12, DAY + timedelta(days=1), DAY + timedelta(days=3), False)
+    assert numbers(index.search(*nights(1, DAY + timedelta(days=1)))[0]) == [102, 201, 301]
+    # an unknown room (added since the load) is ignored
+    index.apply(99, DAY, DAY + timedelta(days=1), True)
+    assert not index._booked.get(DAY + timedelta(days=2))
+
+
+def test_changes_during_a_reload_are_replayed():
+    index = AvailabilityIndex()
+    # a booking commits while the reload is reading MySQL; the rows it reads predate it
+    db = FakeDB(ROOMS, [], on_execute=lambda: index.apply(13, DAY, DAY + timedelta(days=1), True))
+    index.load(db)
+    assert numbers(index.search(*nights(1))[0]) == [101, 102, 301]
+
+
+def test_invalidate_during_a_reload_keeps_the_index_stale():
+    index = AvailabilityIndex()
+    index.load(FakeDB(ROOMS, [], on_execute=index.invalidate))
+    assert index.loaded_at is None
+    index.load(FakeDB(ROOMS, []))
+    assert index.loaded_at is not None
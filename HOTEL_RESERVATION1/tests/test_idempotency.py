@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+
+import idempotency
+from idempotency import MemoryStore
+
+RESPONSE = (201, [("Content-Type", "application/json")], b'{"status": "success"}')
+
+
+def test_first_claim_owns_the_key():
+    store = MemoryStore()
+    owner, record = store.claim("1:/book_room:k", "fp")
+    assert owner and record["fp"] == "fp" and record["response"] is None
+    again, existing = store.claim("1:/book_room:k", "fp")
+    assert not again and existing is record
+
+
+def test_finished_response_is_returned():
+    store = MemoryStore()
+    _, record = store.claim("k", "fp")
+    store.finish("k", record, RESPONSE)
+    owner, existing = store.claim("k", "fp")
+    assert not owner and existing["response"] == RESPONSE
+    assert store.wait("k", existing, 0)["response"] == RESPONSE
+
+
+def test_waiter_gets_the_response_once_finished():
+    store = MemoryStore()
+    _, record = store.claim("k", "fp")
+    _, existing = store.claim("k", "fp")
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(store.wait("k", existing, 5)))
+    waiter.start()
+    store.finish("k", record, RESPONSE)
+    waiter.join()
+    assert result[0]["response"] == RESPONSE
+
+
+def test_wait_times_out_on_an_unfinished_record():
+    store = MemoryStore()
+    _, record = store.claim("k", "fp")
+    assert store.wait("k", record, 0.01) is record
+
+
+def test_abandoned_key_can_be_claimed_again():
+    store = MemoryStore()
+    _, record = store.claim("k", "fp")
+    store.abandon("k", record)
+    assert store.wait("k", record, 0) is None
+    owner, fresh = store.claim("k", "fp")
+    assert owner and fresh is not record
+
+
+def test_abandon_leaves_a_newer_claim_alone():
+    store = MemoryStore()
+    _, old = store.claim("k", "fp")
+    store.abandon("k", old)
+    _, new = store.claim("k", "fp")
+    store.abandon("k", old)
+    assert store.claim("k", "fp") == (False, new)
+
+
+def test_records_expire(clock):
+    store = MemoryStore()
+    _, record = store.claim("k", "fp")
+    store.finish("k", record, RESPONSE)
+    clock.advance(idempotency.IDEMPOTENCY_TTL)
+    owner, _ = store.claim("k", "fp")
+    assert owner
+
+
+def test_oldest_records_are_dropped_past_max_keys(clock):
+    store = MemoryStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        store.claim(key, "fp")
+    store.claim("d", "fp")
+    assert list(store._records) == ["c", "d"]
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("flask")
+
+import otp
+from otp import MemoryStore, RateLimited
+
+
+def test_code_verifies_once():
+    store = MemoryStore()
+    code = store.issue(1, "payment")
+    assert len(code) == otp.DIGITS
+    assert store.verify(1, "payment", code)
+    assert not store.verify(1, "payment", code)
+
+
+def test_code_is_bound_to_user_and_purpose():
+    store = MemoryStore()
+    code = store.issue(1, "payment")
+    assert not store.verify(2, "payment", code)
+    assert not store.verify(1, "login", code)
+    assert store.verify(1, "payment", code)
+
+
+def test_new_code_replaces_the_old_one(monkeypatch):
+    codes = iter(["111111", "222222"])
+    monkeypatch.setattr(otp, "new_code", lambda: next(codes))
+    store = MemoryStore()
+    store.issue(1, "payment")
+    store.issue(1, "payment")
+    assert not store.verify(1, "payment", "111111")
+    assert store.verify(1, "payment", "222222")
+
+
+def test_code_expires(clock):
+    store = MemoryStore()
+    code = store.issue(1, "payment")
+    clock.advance(otp.TTL)
+    assert not store.verify(1, "payment", code)
+
+
+def test_code_is_burned_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(otp, "new_code", lambda: "123456")
+    store = MemoryStore()
+    store.issue(1, "payment")
+    for _ in range(otp.MAX_ATTEMPTS):
+        assert not store.verify(1, "payment", "000000")
+    assert not store.verify(1, "payment", "123456")
+
+
+def test_issues_are_rate_limited_per_window(clock):
+    store = MemoryStore()
+    for _ in range(otp.MAX_ISSUES):
+        store.issue(1, "payment")
+    with pytest.raises(RateLimited) as e:
+        store.issue(1, "payment")
+    assert 0 < e.value.retry_after <= otp.WINDOW + 1
+    store.issue(2, "payment")       # other users are unaffected
+
+    clock.advance(otp.WINDOW)
+    store.issue(1, "payment")
+
+
+def test_expired_entries_are_swept(clock):
+    store = MemoryStore()
+    for user_id in range(10):
+        store.issue(user_id, "payment")
+    clock.advance(otp.WINDOW)
+    store.issue(99, "payment")
+    assert list(store._codes) == ["99:payment"]
+    assert list(store._issues) == [99]
+
+
+def test_oldest_codes_are_dropped_past_max_entries(clock):
+    store = MemoryStore(max_entries=2)
+    for user_id in range(4):
+        store.issue(user_id, "payment")
+    assert list(store._codes) == ["2:payment", "3:payment"]
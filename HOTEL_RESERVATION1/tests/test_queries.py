@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("flask")
+
+from migrations import HOT_QUERIES, explain_hot_queries
+
+# the index each hot query in migrations.HOT_QUERIES must use
+EXPECTED_KEYS = {
+    "login": "idx_users_email_normalized",
+    "user_booking": "idx_bookings_user",
+    "room_overlap": "idx_bookings_room_dates",
+    "recent_actions": "idx_actions_time",
+    "active_bookings": "idx_bookings_status_checkin",
+    "expired_stays": "idx_bookings_status_checkout",
+    "rooms_by_type": "idx_rooms_type_floor",
+}
+
+
+@pytest.fixture
+def plans(db):
+    return {name: key for name, _, key in explain_hot_queries(db)}
+
+
+def test_every_hot_query_has_an_expected_key():
+    assert {name for name, _, _ in HOT_QUERIES} == set(EXPECTED_KEYS)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED_KEYS))
+def test_hot_query_uses_index(plans, name):
+    assert plans[name] == EXPECTED_KEYS[name]
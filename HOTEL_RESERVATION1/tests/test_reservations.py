@@ -0,0 +1,154 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("flask")
+
+import database
+from reservations import ADJACENT, ANY, SAME_FLOOR, choose_rooms
+
+# POST /book_room requests, spread over STRESS_ROOMS rooms
+STRESS_BOOKINGS = int(os.environ.get("STRESS_BOOKINGS", 2000))
+STRESS_ROOMS    = 5
+# STAY_NIGHTS-night stays starting on one of STAY_STARTS days, so some overlap and some don't
+FIRST_NIGHT     = date(2099, 1, 1)
+STAY_STARTS     = 8
+STAY_NIGHTS     = 3
+
+
+# (id, number, room_type, floor) as find_available_rooms() returns them
+ROOMS = [
+    (1, 101, "Standard", 1), (2, 102, "Standard", 1), (3, 104, "Standard", 1),
+    (4, 201, "Standard", 2), (5, 202, "Standard", 2), (6, 203, "Standard", 2),
+    (7, 301, "Standard", None),
+]
+
+
+def ids(rooms):
+    return [r[0] for r in rooms] if rooms is not None else None
+
+
+def test_adjacent_takes_the_first_consecutive_run():
+    assert ids(choose_rooms(ROOMS, 2, ADJACENT)) == [1, 2]
+    assert ids(choose_rooms(ROOMS, 3, ADJACENT)) == [4, 5, 6]
+    assert choose_rooms(ROOMS, 4, ADJACENT) is None
+
+
+def test_adjacent_ignores_input_order():
+    assert ids(choose_rooms(list(reversed(ROOMS)), 3, ADJACENT)) == [4, 5, 6]
+
+
+def test_same_floor_prefers_the_lowest_floor():
+    assert ids(choose_rooms(ROOMS, 3, SAME_FLOOR)) == [1, 2, 3]
+    assert choose_rooms(ROOMS, 4, SAME_FLOOR) is None
+
+
+def test_any_fills_the_fullest_floors_first():
+    rooms = ROOMS[:4] + [(8, 204, "Standard", 2), (9, 205, "Standard", 2)] + ROOMS[4:]
+    assert ids(choose_rooms(rooms, 6, ANY)) == [4, 5, 6, 8, 9, 1]
+    assert choose_rooms(ROOMS, len(ROOMS) + 1, ANY) is None
+
+
+def test_rooms_without_a_floor_only_make_up_the_count():
+    assert ids(choose_rooms(ROOMS, 7, ANY)) == [1, 2, 3, 4, 5, 6, 7]
+    only_unknown = [(7, 301, "Standard", None), (8, 302, "Standard", None)]
+    assert choose_rooms(only_unknown, 2, ADJACENT) is None
+    assert choose_rooms(only_unknown, 2, SAME_FLOOR) is None
+    assert ids(choose_rooms(only_unknown, 2, ANY)) == [7, 8]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        choose_rooms(ROOMS, 1, "penthouse")
+
+
+# ---------------------------------------------------------------- concurrent bookings (MySQL)
+
+@pytest.fixture
+def app(monkeypatch):
+    from admission import LIMITS
+    from app import create_app
+    app = create_app()
+    # admission control would turn most of the burst away with 429
+    limit = LIMITS["booking"]
+    monkeypatch.setattr(limit, "ip", None)
+    monkeypatch.setattr(limit, "user", None)
+    monkeypatch.setattr(limit, "concurrency", STRESS_BOOKINGS)
+    app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture
+def guest(db):
+    cur = db.cursor()
+    cur.execute("INSERT INTO users (name, email, password_hash) VALUES ('Stress Guest', %s, '-')",
+                (f"stress-{os.getpid()}@example.com",))
+    user_id = cur.lastrowid
+    yield user_id
+    cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
+    cur.close()
+
+
+@pytest.fixture
+def rooms(db):
+    cur = db.cursor()
+    cur.execute("SELECT COALESCE(MAX(number), 0) + 1 FROM rooms")
+    first = max(cur.fetchone()[0], 90000)
+    numbers = list(range(first, first + STRESS_ROOMS))
+    cur.executemany("INSERT INTO rooms (number, room_type, floor) VALUES (%s, 'Stress', 1)",
+                    [(n,) for n in numbers])
+    yield numbers
+    # bookings go with their rooms (ON DELETE CASCADE)
+    cur.execute("DELETE FROM rooms WHERE number IN %s", (numbers,))
+    cur.close()
+
+
+def test_concurrent_bookings_never_overlap(db, app, guest, rooms):
+    # one client per worker; each worker holds a pooled connection while it books
+    workers = max(2, database.POOL_SIZE - 2)
+
+    def run(worker):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["user_id"], s["user_name"] = guest, "Stress Guest"
+        results = []
+        for i in range(worker, STRESS_BOOKINGS, workers):
+            check_in = FIRST_NIGHT + timedelta(days=i % STAY_STARTS)
+            response = client.post("/book_room", data={
+                "room_number": rooms[i % STRESS_ROOMS], "room_type": "Stress",
+                "check_in": check_in.isoformat(),
+                "check_out": (check_in + timedelta(days=STAY_NIGHTS)).isoformat(),
+            })
+            results.append((response.status_code, response.get_json()["status"]))
+        return results
+
+    with ThreadPoolExecutor(workers) as pool:
+        results = [r for worker in pool.map(run, range(workers)) for r in worker]
+
+    # every request either booked its stay or lost with a 409
+    assert Counter(results).keys() <= {(200, "success"), (409, "error")}
+    won = results.count((200, "success"))
+
+    cur = db.cursor()
+    cur.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT b.room_id) FROM bookings b JOIN rooms r ON b.room_id = r.id
+         WHERE r.number IN %s AND b.status = 'booked'
+    """, (rooms,))
+    rows, rooms_booked = cur.fetchone()
+    cur.execute("""
+        SELECT COUNT(*)
+          FROM bookings a
+          JOIN bookings b ON a.room_id = b.room_id AND a.id < b.id
+          JOIN rooms r ON a.room_id = r.id
+         WHERE r.number IN %s AND a.status = 'booked' AND b.status = 'booked'
+           AND a.check_in < b.check_out AND a.check_out > b.check_in
+    """, (rooms,))
+    overlapping = cur.fetchone()[0]
+    cur.close()
+
+    assert overlapping == 0
+    assert rows == won
+    assert rooms_booked == STRESS_ROOMS
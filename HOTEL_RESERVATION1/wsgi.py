@@ -0,0 +1,35 @@
+"""
+WSGI entry point for production.
+
+    python migrations.py                              # release step, once per deploy
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Importing this module builds the app and checks (never changes) the schema;
+workers with migrations pending stay out of rotation via /readyz. For release
+pipelines,
+
+    python wsgi.py --check
+
+exits 1 while migrations are pending.
+"""
+import sys
+
+import MySQLdb
+
+import lifecycle
+from app import create_app
+from database import PoolExhausted
+
+application = create_app()
+
+try:
+    lifecycle.check_schema()
+except (MySQLdb.Error, PoolExhausted) as e:
+    # not fatal: /readyz keeps checking until the database is reachable
+    print("Error checking schema:", e)
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        sys.exit(1 if lifecycle.state.pending is None or lifecycle.state.pending else 0)
+    print(__doc__)